@@ -18,7 +18,13 @@ import time
 import logging
 import yaml
 import warnings
-from typing import List, Dict, Any, Optional
+import heapq
+from bisect import bisect_left
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import islice
+from operator import itemgetter
+from typing import List, Dict, Any, Optional, Tuple, Hashable, Union
 import pandas as pd
 import numpy as np
 from influxdb_client import InfluxDBClient
@@ -34,23 +40,257 @@ from providers import get_provider
 
 logger = logging.getLogger(__name__)
 
+# Aggregeringsfönster per tidsenhet: (inklusiva övre gränser, fönster, fönster över sista gränsen)
+_AGG_WINDOWS = {
+    'h': ((1, 6, 24), ('1m', '3m', '5m'), '15m'),   # 1h ~60, 6h ~120, 24h ~288 datapunkter
+    'd': ((1, 7, 30), ('5m', '30m', '2h'), '6h'),   # 1d ~288, 7d ~336, 30d ~360 datapunkter
+}
+
+# Finer windows for COP visualization (10m for both 7d and 30d)
+_COP_AGG_WINDOWS = {
+    'h': ((1, 6, 24), ('1m', '2m', '5m'), '10m'),
+    'd': ((1, 7, 30), ('5m', '10m', '10m'), '1h'),  # 7d ~1000, 30d ~4320 datapunkter
+}
+
+_DEFAULT_AGG_WINDOW = '5m'
+
+
+def _lookup_window(table: Dict[str, tuple], time_range: str) -> str:
+    """Resolve a time range like '24h' or '7d' against a window table"""
+    unit = time_range[-1:]
+    if unit not in table:
+        return _DEFAULT_AGG_WINDOW
+    try:
+        value = int(time_range[:-1])
+    except ValueError:
+        return _DEFAULT_AGG_WINDOW
+
+    thresholds, windows, above = table[unit]
+    index = bisect_left(thresholds, value)
+    return windows[index] if index < len(windows) else above
+
+
+@lru_cache(maxsize=32)
+def _aggregation_window(time_range: str) -> str:
+    return _lookup_window(_AGG_WINDOWS, time_range)
+
+
+@lru_cache(maxsize=32)
+def _cop_aggregation_window(time_range: str) -> str:
+    return _lookup_window(_COP_AGG_WINDOWS, time_range)
+
+
+@lru_cache(maxsize=64)
+def _name_predicate(metric_names: frozenset) -> str:
+    # contains(set: [...]) is not pushed down to the storage read in InfluxDB 2.x,
+    # equality tests joined with "or" are
+    return ' or '.join(f'r.name == "{name}"' for name in sorted(metric_names))
+
+
+@lru_cache(maxsize=4)
+def _influx_client(url: str, token: Optional[str], org: str) -> InfluxDBClient:
+    """
+    Shared InfluxDB client per (url, token, org)
+
+    The client owns the urllib3 connection pool, so sharing it lets every
+    HeatPumpDataQuery instance reuse warm keep-alive connections instead of
+    opening new ones. Timeout in ms covers long 30d queries. Responses are
+    gzip-compressed: the annotated CSV from Flux is highly repetitive.
+    """
+    return InfluxDBClient(url=url, token=token, org=org, timeout=30_000,
+                          enable_gzip=True, connection_pool_maxsize=32)
+
+
+def _time_ns(df: pd.DataFrame) -> np.ndarray:
+    """_time as int64 nanoseconds (the _time_ns column from query_metrics when present)"""
+    if '_time_ns' in df.columns:
+        return df['_time_ns'].to_numpy()
+    return df['_time'].values.astype('datetime64[ns]').view('int64')
+
+
+def _time_diff_hours(times_ns: np.ndarray) -> np.ndarray:
+    """Hours since the previous timestamp (0 for the first) from int64 ns / datetime64[ns] values"""
+    hours = np.zeros(len(times_ns))
+    hours[1:] = np.diff(times_ns.view('int64')) / 3.6e12
+    return hours
+
+
+def _hw_cycles(vt: np.ndarray, vv: np.ndarray, pt: np.ndarray, pv: np.ndarray) -> tuple:
+    """
+    Hot water cycle kernel on plain arrays (no pandas objects)
+
+    Args:
+        vt, vv: Sorted switch valve timestamps (int64 ns) and values
+        pt, pv: Sorted power timestamps (int64 ns) and values (W)
+
+    Returns:
+        (num_starts, start_ns, end_ns, durations_min, energies_kwh) for every
+        0→1 start that has an end; energy is NaN when no power samples fall
+        inside the cycle
+    """
+    start_idx = np.flatnonzero((vv[1:] == 1) & (vv[:-1] == 0)) + 1
+    start_ns = vt[start_idx]
+
+    # End = first sample with value 0 strictly after the start time
+    zero_ns = vt[vv == 0]
+    end_pos = np.searchsorted(zero_ns, start_ns, side='right')
+    has_end = end_pos < len(zero_ns)
+    start_ns = start_ns[has_end]
+    end_ns = zero_ns[end_pos[has_end]]
+
+    durations_min = (end_ns - start_ns) / 6e10
+
+    # Energy = Power (W) * Time (h) / 1000 = kWh, integrated over the samples
+    # inside [start, end] using the real time since the previous sample
+    # Prefix sum: cum_kwh[k] = energy of samples 0..k-1, so a cycle is cum_kwh[hi] - cum_kwh[lo + 1]
+    power_energy_kwh = np.nan_to_num(pv * _time_diff_hours(pt) / 1000)
+    cum_kwh = np.concatenate(([0.0], np.cumsum(power_energy_kwh, dtype=np.float64)))
+
+    lo = np.searchsorted(pt, start_ns, side='left')
+    hi = np.searchsorted(pt, end_ns, side='right')
+
+    has_power = hi > lo
+    energies_kwh = np.full(len(start_ns), np.nan)
+    energies_kwh[has_power] = cum_kwh[hi[has_power]] - cum_kwh[lo[has_power] + 1]
+
+    return len(start_idx), start_ns, end_ns, durations_min, energies_kwh
+
+
+def _state_edges(previous: np.ndarray, current: np.ndarray,
+                 on_value: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Indices of rising (0 → on) and falling (on → 0) edges between paired samples
+
+    A sample is on when value > 0, or value == on_value if given; NaN samples
+    are neither on nor off. Indices point into current.
+    """
+    if on_value is None:
+        prev_on, cur_on = previous > 0, current > 0
+    else:
+        prev_on, cur_on = previous == on_value, current == on_value
+    rising = np.flatnonzero((previous == 0) & cur_on)
+    falling = np.flatnonzero(prev_on & (current == 0))
+    return rising, falling
+
+
+def _cumulative_cycle_energy(start_ns: np.ndarray, end_ns: np.ndarray,
+                             t_ns: np.ndarray, cum_kwh: np.ndarray) -> np.ndarray:
+    """
+    Per-cycle energy from a cumulative kWh series (InfluxDB-side integration)
+
+    Returns cum(end) - cum(start), interpolated at the cycle bounds; NaN for
+    cycles without any cumulative sample inside [start, end]
+    """
+    energies_kwh = np.full(len(start_ns), np.nan)
+    if len(t_ns) == 0:
+        return energies_kwh
+
+    lo = np.searchsorted(t_ns, start_ns, side='left')
+    hi = np.searchsorted(t_ns, end_ns, side='right')
+    has_power = hi > lo
+    energies_kwh[has_power] = (np.interp(end_ns[has_power], t_ns, cum_kwh) -
+                               np.interp(start_ns[has_power], t_ns, cum_kwh))
+    return energies_kwh
+
 
 class HeatPumpDataQuery:
     """Query data from InfluxDB with advanced calculations"""
 
+    # Flux templates shared by the query methods. Metric names are rendered by
+    # _name_filter() in sorted order, so identical requests produce identical
+    # query text from one dashboard refresh to the next.
+    _FLUX_AGGREGATE = '''from(bucket: "{bucket}")
+                    |> range(start: -{time_range})
+                    |> filter(fn: (r) => r._measurement == "heatpump")
+                    |> filter(fn: (r) => {name_filter})
+                    |> aggregateWindow(every: {every}, fn: {fn}, createEmpty: false)'''
+
+    # Projection for long-format results: drops _start/_stop/_measurement and the
+    # remaining tags before serialization, since callers only read these columns
+    _FLUX_KEEP = '''
+                    |> keep(columns: ["_time", "name", "_value", "unit"])'''
+
+    # Result cache for dashboard refreshes (seconds / entries); the collector writes every 30s
+    _QUERY_CACHE_TTL = 30.0
+    _QUERY_CACHE_MAXSIZE = 32
+    _EVENT_LOG_CACHE_TTL = 10.0
+    # Derived results over day ranges (5-30 min aggregation windows) change far slower
+    _LONG_RANGE_CACHE_TTL = 300.0
+
+    # Event log templates: (metric, edge) -> (event, type, icon)
+    # edge: 'on' = 0→>0, 'off' = >0→0, 'level' = change > 10 while on.
+    # '{}' is filled with the value (%) or, for alarm_code, the alarm description.
+    _EVENT_TEMPLATES = {
+        ('compressor_status', 'on'): ('Kompressor PÅ', 'info', '🔄'),
+        ('compressor_status', 'off'): ('Kompressor AV', 'info', '⏸️'),
+        ('brine_pump_status', 'on'): ('Köldbärarpump PÅ', 'info', '💧'),
+        ('brine_pump_status', 'off'): ('Köldbärarpump AV', 'info', '💧'),
+        ('radiator_pump_status', 'on'): ('Radiatorpump PÅ', 'info', '📡'),
+        ('radiator_pump_status', 'off'): ('Radiatorpump AV', 'info', '📡'),
+        ('switch_valve_status', 'on'): ('Varmvattencykel START', 'info', '🚿'),
+        ('switch_valve_status', 'off'): ('Varmvattencykel STOPP', 'info', '🚿'),
+        # Larmstatus (IVT uses alarm_status to signal active alarms)
+        ('alarm_status', 'on'): ('Larm aktiverat', 'danger', '⚠️'),
+        ('alarm_status', 'off'): ('Larm återställt', 'success', '✅'),
+        ('additional_heat_percent', 'on'): ('Tillsattsvärme PÅ ({}%)', 'warning', '🔥'),
+        ('additional_heat_percent', 'off'): ('Tillsattsvärme AV', 'info', '🔥'),
+        ('additional_heat_percent', 'level'): ('Tillsattsvärme ändrad till {}%', 'warning', '🔥'),
+        ('alarm_code', 'on'): ('LARM - {}', 'danger', '⚠️'),
+        ('alarm_code', 'off'): ('Larm återställt', 'success', '✅'),
+    }
+
+    # (metric, edge) keys whose text carries the value (alarm code, aux heater %)
+    _VALUE_EVENT_KEYS = frozenset(key for key, (text, _, _) in _EVENT_TEMPLATES.items() if '{}' in text)
+
+    # Metrics whose events only depend on the edge (no value in the message)
+    _BINARY_EVENT_METRICS = (
+        'compressor_status',
+        'brine_pump_status',
+        'radiator_pump_status',
+        'switch_valve_status',
+        'alarm_status',
+    )
+
+    # Metrics used by the COP calculation (heat_carrier_* are the IVT alternative sensors)
+    _COP_METRICS = frozenset({
+        'radiator_forward',
+        'radiator_return',
+        'heat_carrier_forward',
+        'heat_carrier_return',
+        'brine_in_evaporator',
+        'brine_out_condenser',
+        'power_consumption',
+        'compressor_status',
+    })
+
+    # Wide format: keep() drops _start/_stop/_measurement and the tag columns on the server
+    # (not sent, not parsed) and removes them from the group key, so pivot() yields one
+    # time-aligned table instead of one per series
+    _FLUX_PIVOT = '''
+                    |> keep(columns: ["_time", "name", "_value"])
+                    |> pivot(rowKey: ["_time"], columnKey: ["name"], valueColumn: "_value")
+                    |> sort(columns: ["_time"])'''
+
     def __init__(self, config_path: str = '/app/config.yaml'):
         """Initialize InfluxDB client and load provider"""
         self.url = os.getenv('INFLUXDB_URL', 'http://influxdb:8086')
         self.token = os.getenv('INFLUXDB_TOKEN')
         self.org = os.getenv('INFLUXDB_ORG', 'thermia')
         self.bucket = os.getenv('INFLUXDB_BUCKET', 'heatpump')
-        self.client = InfluxDBClient(url=self.url, token=self.token, org=self.org)
+        self.client = _influx_client(self.url, self.token, self.org)
         self.query_api = self.client.query_api()
 
         # Load provider and settings based on config
         self.provider, self.cop_flow_factor, self.hw_min_cycle_minutes = self._load_provider_and_settings(config_path)
         self.alarm_codes = self.provider.get_alarm_codes()
         self.alarm_register_id = self.provider.get_alarm_register_id()
+        # Provider metadata is static: build the status field set once, not per query
+        self._status_fields_set = frozenset(self.provider.get_status_field_names())
+        self._register_names = frozenset(reg['name'] for reg in self.provider.get_registers().values())
+        self._event_text_cache: Dict[tuple, str] = {}
+        self._cached_alarm_time: Optional[tuple] = None  # (alarm_code, alarm_time or None)
+        # Short-lived result cache: a dashboard refresh runs several analyses over the same data
+        self._query_cache: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
         logger.info(f"Data query initialized for {self.provider.get_display_name()}, COP flow factor: {self.cop_flow_factor}, HW min cycle: {self.hw_min_cycle_minutes} min")
 
     def _load_provider_and_settings(self, config_path: str):
@@ -80,103 +320,224 @@ class HeatPumpDataQuery:
             from providers.thermia.provider import ThermiaProvider
             return ThermiaProvider(), cop_flow_factor, hw_min_cycle_minutes
     
+    def _cache_get(self, key: Hashable, ttl: Optional[float] = None) -> Any:
+        """Return a cached result younger than ttl seconds (default _QUERY_CACHE_TTL), else None"""
+        entry = self._query_cache.get(key)
+        if entry is None:
+            return None
+        timestamp, value = entry
+        if time.monotonic() - timestamp >= (self._QUERY_CACHE_TTL if ttl is None else ttl):
+            del self._query_cache[key]
+            return None
+        self._query_cache.move_to_end(key)
+        return value
+
+    def _cache_put(self, key: Hashable, value: Any):
+        """Store a result, evicting the least recently used entries above _QUERY_CACHE_MAXSIZE"""
+        self._query_cache[key] = (time.monotonic(), value)
+        self._query_cache.move_to_end(key)
+        while len(self._query_cache) > self._QUERY_CACHE_MAXSIZE:
+            self._query_cache.popitem(last=False)
+
+    def _result_cache_ttl(self, time_range: str) -> float:
+        """Cache lifetime for derived results: one collector interval for hour ranges, longer for day ranges"""
+        return self._LONG_RANGE_CACHE_TTL if time_range.endswith('d') else self._QUERY_CACHE_TTL
+
+    def _event_text(self, metric: str, edge: str, value: int) -> str:
+        """
+        Event log text for a value-bearing template (alarm code, aux heater %)
+
+        Cached per (metric, edge, value), so every event with the same text
+        shares one string object instead of formatting a new one.
+        """
+        key = (metric, edge, value)
+        text = self._event_text_cache.get(key)
+        if text is None:
+            template = self._EVENT_TEMPLATES[(metric, edge)][0]
+            if metric == 'alarm_code':
+                text = template.format(self.alarm_codes.get(value, f"Kod {value}"))
+            else:
+                text = template.format(value)
+            self._event_text_cache[key] = text
+        return text
+
+    @staticmethod
+    def _sort_by_time(df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Sort on _time unless it already is sorted (e.g. a subset of query_metrics output)
+
+        Checked on the data (O(n), no copy) rather than trusted from a flag, since
+        pandas carries attrs through reordering operations.
+        """
+        if df['_time'].is_monotonic_increasing:
+            return df
+        return df.sort_values('_time')
+
+    @staticmethod
+    def _metric_edges(metric: str, previous: np.ndarray, current: np.ndarray,
+                      on_value: Optional[float] = None) -> Dict[str, np.ndarray]:
+        """Edge indices into current per _EVENT_TEMPLATES edge ('on', 'off' and 'level' for the aux heater)"""
+        rising, falling = _state_edges(previous, current, on_value)
+        edges = {'on': rising, 'off': falling}
+
+        if metric == 'additional_heat_percent':
+            # Significant change: both >0 and |delta| > 10
+            edges['level'] = np.flatnonzero((current > 0) & (previous > 0) & (np.abs(current - previous) > 10))
+
+        return edges
+
+    def _metric_events(self, metric: str, times, values: np.ndarray,
+                       on_value: Optional[float] = None,
+                       previous: Optional[np.ndarray] = None,
+                       limit: Optional[int] = None) -> List[tuple]:
+        """
+        Compact (time, metric, edge, value) events for one time-sorted metric
+
+        Each sample is compared with the one before it, or with previous[i] when
+        given (rows that already carry their predecessor, see get_event_log).
+        Returned newest first, so the per-metric lists can be merged with
+        heapq.merge(..., reverse=True) without a global sort. With limit, only
+        the newest `limit` events are built (no more can reach the event log).
+        """
+        if previous is None:
+            previous, times, values = values[:-1], times[1:], values[1:]
+
+        edges = self._metric_edges(metric, previous, values, on_value)
+        indices = np.concatenate(list(edges.values()))
+        if len(indices) == 0:
+            return []
+
+        # Labels via np.repeat and a fixed-size result from zip: no per-event appends
+        labels = np.repeat(np.array(list(edges), dtype=object), [len(i) for i in edges.values()])
+
+        order = np.argsort(indices, kind='stable')[::-1][:limit]
+        indices = indices[order]
+        return list(zip(times[indices], [metric] * len(indices), labels[order], values[indices]))
+
+    @staticmethod
+    def _events_frame(events: List[Dict[str, Any]]) -> pd.DataFrame:
+        """Columnar event log: one row per event, categorical event/type/icon columns"""
+        frame = pd.DataFrame(events, columns=['time', 'event', 'type', 'icon'])
+        return frame.astype({'event': 'category', 'type': 'category', 'icon': 'category'})
+
+    def _event_dict(self, event: tuple) -> Dict[str, Any]:
+        """Expand a (time, metric, edge, value) event to the public event dict"""
+        timestamp, metric, edge, value = event
+        key = (metric, edge)
+        text, event_type, icon = self._EVENT_TEMPLATES[key]
+
+        # Larm (brand-aware) och tillsattsvärme har värdet i texten - a set lookup, no string compares
+        if key in self._VALUE_EVENT_KEYS:
+            text = self._event_text(metric, edge, int(value))
+
+        return {'time': timestamp, 'event': text, 'type': event_type, 'icon': icon}
+
     def _get_aggregation_window(self, time_range: str) -> str:
         """
         NYTT: Dynamisk aggregering baserat på tidsperiod
 
         Returnerar lämpligt aggregeringsfönster för att balansera prestanda och noggrannhet.
         Mer aggressiv nedsampling för längre perioder för bättre prestanda.
+        Slås upp i _AGG_WINDOWS (okänt format ger 5m).
         """
-        # Extrahera numeriskt värde och enhet från time_range (t.ex. "24h", "7d")
-        if time_range.endswith('h'):
-            hours = int(time_range[:-1])
-            if hours <= 1:
-                return "1m"   # 1 timme = 1 minut aggregering (~60 datapunkter)
-            elif hours <= 6:
-                return "3m"   # 6 timmar = 3 minuter (~120 datapunkter)
-            elif hours <= 24:
-                return "5m"   # 24 timmar = 5 minuter (~288 datapunkter)
-            else:
-                return "15m"  # >24 timmar = 15 minuter
-        elif time_range.endswith('d'):
-            days = int(time_range[:-1])
-            if days <= 1:
-                return "5m"   # 1 dag = 5 minuter (~288 datapunkter)
-            elif days <= 7:
-                return "30m"  # 7 dagar = 30 minuter (~336 datapunkter) - IMPROVED
-            elif days <= 30:
-                return "2h"   # 30 dagar = 2 timmar (~360 datapunkter) - IMPROVED
-            else:
-                return "6h"   # >30 dagar = 6 timmar
-        else:
-            return "5m"  # Default
-    
+        return _aggregation_window(time_range)
+
+    @staticmethod
+    def _name_filter(metric_names: List[str]) -> str:
+        """
+        Build the Flux name predicate for a list of metrics
+
+        Uses an or-chain of equality tests (pushed down to the storage engine)
+        with names deduplicated and sorted so the query text is stable.
+        Built once per metric set (see _name_predicate).
+        """
+        return _name_predicate(frozenset(metric_names))
+
+    def _aggregate_stream(self, metric_names: List[str], time_range: str,
+                          aggregation_window: str, fn: str) -> str:
+        """Render _FLUX_AGGREGATE for a set of metrics"""
+        return self._FLUX_AGGREGATE.format(
+            bucket=self.bucket,
+            time_range=time_range,
+            name_filter=self._name_filter(metric_names),
+            every=aggregation_window,
+            fn=fn
+        )
+
     def query_metrics(self, metric_names: List[str], time_range: str = '24h',
-                     aggregation_window: Optional[str] = None) -> pd.DataFrame:
+                     aggregation_window: Optional[str] = None,
+                     per_metric_window: Optional[Dict[str, str]] = None) -> pd.DataFrame:
         """
         Query metrics from InfluxDB
 
         FÖRBÄTTRING: Nu med konfigurerbar aggregering
+        OPTIMIZED: Results are cached for _QUERY_CACHE_TTL seconds, so the analyses
+        of one dashboard refresh share a single InfluxDB round trip per query
 
         Args:
             metric_names: Lista över metrics att hämta
             time_range: Tidsperiod (t.ex. '24h', '7d')
             aggregation_window: Specifikt aggregeringsfönster (None = automatisk)
+            per_metric_window: Aggregeringsfönster per metric, överstyr aggregation_window
+                (t.ex. {'power_consumption': '5m'})
         """
-        try:
-            # Get status fields from provider (brand-aware)
-            # Status fields should use 'last' aggregation, not 'mean'
-            # (averaging 0/1 values gives meaningless fractional results)
-            status_fields = set(self.provider.get_status_field_names())
-
-            # Split metrics into status and non-status
-            status_metrics = [m for m in metric_names if m in status_fields]
-            value_metrics = [m for m in metric_names if m not in status_fields]
+        # Deduplicate (keeping order) and skip the round trip when nothing is requested
+        metric_names = list(dict.fromkeys(metric_names))
+        if not metric_names:
+            return pd.DataFrame()
 
-            # Använd angiven aggregering eller beräkna automatiskt
-            if aggregation_window is None:
-                aggregation_window = self._get_aggregation_window(time_range)
+        # Använd angiven aggregering eller beräkna automatiskt
+        if aggregation_window is None:
+            aggregation_window = self._get_aggregation_window(time_range)
 
-            results = []
+        # Callers sort/add columns on the result, so hand out copies of the cached frame
+        per_metric_window = per_metric_window or {}
+        cache_key = ('query_metrics', tuple(sorted(metric_names)), time_range, aggregation_window,
+                     tuple(sorted(per_metric_window.items())))
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached.copy()
 
-            # Query value metrics with mean aggregation
-            if value_metrics:
-                name_filter = ' or '.join([f'r.name == "{name}"' for name in value_metrics])
-                query = f'''
-                    from(bucket: "{self.bucket}")
-                        |> range(start: -{time_range})
-                        |> filter(fn: (r) => r._measurement == "heatpump")
-                        |> filter(fn: (r) => {name_filter})
-                        |> aggregateWindow(every: {aggregation_window}, fn: mean, createEmpty: false)
-                        |> yield(name: "mean")
-                '''
-                result = self.query_api.query_data_frame(query)
-                if isinstance(result, list):
-                    result = pd.concat(result, ignore_index=True)
-                if not result.empty:
-                    results.append(result)
-
-            # Query status metrics with last aggregation (preserves 0/1 values)
-            if status_metrics:
-                name_filter = ' or '.join([f'r.name == "{name}"' for name in status_metrics])
-                query = f'''
-                    from(bucket: "{self.bucket}")
-                        |> range(start: -{time_range})
-                        |> filter(fn: (r) => r._measurement == "heatpump")
-                        |> filter(fn: (r) => {name_filter})
-                        |> aggregateWindow(every: {aggregation_window}, fn: last, createEmpty: false)
-                        |> yield(name: "last")
-                '''
-                result = self.query_api.query_data_frame(query)
-                if isinstance(result, list):
-                    result = pd.concat(result, ignore_index=True)
-                if not result.empty:
-                    results.append(result)
+        try:
+            # Status fields (brand-aware, see _status_fields_set) should use 'last' aggregation,
+            # not 'mean' (averaging 0/1 values gives meaningless fractional results)
+            status_fields = self._status_fields_set
+
+            # Group metrics per (aggregation function, window) in one pass
+            streams: Dict[tuple, List[str]] = {}
+            for metric in metric_names:
+                fn = 'last' if metric in status_fields else 'mean'
+                streams.setdefault((fn, per_metric_window.get(metric, aggregation_window)), []).append(metric)
+
+            # Value metrics use mean aggregation, status metrics last (preserves 0/1 values).
+            # All streams (incl. per_metric_window ones) are unioned into one request: one round trip
+            data = [self._aggregate_stream(names, time_range, window, fn)
+                    for (fn, window), names in streams.items()]
+            if len(data) > 1:
+                data = [f"union(tables: [{', '.join(data)}])"]
+            query = data[0] + self._FLUX_KEEP
 
             logger.debug(f"Querying metrics with {aggregation_window} aggregation for {time_range}")
 
-            if results:
-                return pd.concat(results, ignore_index=True)
+            df = self.query_api.query_data_frame(query)
+            # A list of frames comes back when tables differ in schema: join without copies or column sorting
+            if isinstance(df, list):
+                df = pd.concat(df, ignore_index=True, copy=False, sort=False)
+
+            if not df.empty:
+                # Typed columns only: drop the client's object-dtype 'result'/'table' columns and
+                # make name/unit categorical, so df[df['name'] == x] compares int codes instead of strings.
+                # _value stays float64: it is serialized unrounded to the charts, and cumulative
+                # counters/energy meters need more than float32's ~7 significant digits
+                df = df.drop(columns=['result', 'table'], errors='ignore')
+                dtypes = {'name': 'category', 'unit': 'category'}
+                df = df.astype({col: dtype for col, dtype in dtypes.items() if col in df.columns})
+                # Sort once here; per-metric subsets stay sorted, so callers can skip their re-sorts
+                df = df.sort_values('_time', kind='mergesort', ignore_index=True)
+                # int64 ns timestamps for interval arithmetic without Timedelta objects
+                df['_time_ns'] = df['_time'].values.astype('datetime64[ns]').view('int64')
+                self._cache_put(cache_key, df)
+                return df.copy()
             return pd.DataFrame()
 
         except Exception as e:
@@ -200,72 +561,51 @@ class HeatPumpDataQuery:
 
         Returns:
             DataFrame in wide format with _time as index column
+
+        OPTIMIZED: Results are cached for _QUERY_CACHE_TTL seconds (see query_metrics)
         """
+        # Determine aggregation window
+        if aggregation_window is None:
+            aggregation_window = self._get_aggregation_window(time_range)
+
+        # Callers add columns to the result, so hand out copies of the cached frame
+        cache_key = ('query_metrics_wide', tuple(sorted(set(metric_names))), time_range, aggregation_window)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached.copy()
+
         try:
             start_time = time.time()
 
-            # Get status fields from provider (brand-aware)
-            status_fields = set(self.provider.get_status_field_names())
-
-            # Determine aggregation window
-            if aggregation_window is None:
-                aggregation_window = self._get_aggregation_window(time_range)
+            # Status fields from provider (brand-aware, cached in __init__)
+            status_fields = self._status_fields_set
 
-            # Separate aggregation functions for status vs value fields
+            # Separate aggregation functions for status vs value fields (one pass)
             # Status fields use 'last', value fields use 'mean'
-            status_metrics = [m for m in metric_names if m in status_fields]
-            value_metrics = [m for m in metric_names if m not in status_fields]
+            status_metrics, value_metrics = [], []
+            for metric in metric_names:
+                (status_metrics if metric in status_fields else value_metrics).append(metric)
 
             # Build query based on which metric types we have
             # This avoids empty table issues when only one type is requested
             if value_metrics and status_metrics:
                 # Both types - use union
-                value_filter = ' or '.join([f'r.name == "{m}"' for m in value_metrics])
-                status_filter = ' or '.join([f'r.name == "{m}"' for m in status_metrics])
+                value_data = self._aggregate_stream(value_metrics, time_range, aggregation_window, 'mean')
+                status_data = self._aggregate_stream(status_metrics, time_range, aggregation_window, 'last')
 
                 query = f'''
-                    value_data = from(bucket: "{self.bucket}")
-                        |> range(start: -{time_range})
-                        |> filter(fn: (r) => r._measurement == "heatpump")
-                        |> filter(fn: (r) => {value_filter})
-                        |> aggregateWindow(every: {aggregation_window}, fn: mean, createEmpty: false)
-
-                    status_data = from(bucket: "{self.bucket}")
-                        |> range(start: -{time_range})
-                        |> filter(fn: (r) => r._measurement == "heatpump")
-                        |> filter(fn: (r) => {status_filter})
-                        |> aggregateWindow(every: {aggregation_window}, fn: last, createEmpty: false)
-
-                    union(tables: [value_data, status_data])
-                        |> pivot(rowKey: ["_time"], columnKey: ["name"], valueColumn: "_value")
-                        |> sort(columns: ["_time"])
+                value_data = {value_data}
+
+                status_data = {status_data}
+
+                union(tables: [value_data, status_data]){self._FLUX_PIVOT}
                 '''
             elif value_metrics:
                 # Only value metrics
-                value_filter = ' or '.join([f'r.name == "{m}"' for m in value_metrics])
-
-                query = f'''
-                    from(bucket: "{self.bucket}")
-                        |> range(start: -{time_range})
-                        |> filter(fn: (r) => r._measurement == "heatpump")
-                        |> filter(fn: (r) => {value_filter})
-                        |> aggregateWindow(every: {aggregation_window}, fn: mean, createEmpty: false)
-                        |> pivot(rowKey: ["_time"], columnKey: ["name"], valueColumn: "_value")
-                        |> sort(columns: ["_time"])
-                '''
+                query = self._aggregate_stream(value_metrics, time_range, aggregation_window, 'mean') + self._FLUX_PIVOT
             elif status_metrics:
                 # Only status metrics
-                status_filter = ' or '.join([f'r.name == "{m}"' for m in status_metrics])
-
-                query = f'''
-                    from(bucket: "{self.bucket}")
-                        |> range(start: -{time_range})
-                        |> filter(fn: (r) => r._measurement == "heatpump")
-                        |> filter(fn: (r) => {status_filter})
-                        |> aggregateWindow(every: {aggregation_window}, fn: last, createEmpty: false)
-                        |> pivot(rowKey: ["_time"], columnKey: ["name"], valueColumn: "_value")
-                        |> sort(columns: ["_time"])
-                '''
+                query = self._aggregate_stream(status_metrics, time_range, aggregation_window, 'last') + self._FLUX_PIVOT
             else:
                 # No metrics requested
                 logger.warning("query_metrics_wide: No metrics requested")
@@ -274,19 +614,19 @@ class HeatPumpDataQuery:
             result = self.query_api.query_data_frame(query)
 
             if isinstance(result, list):
-                result = pd.concat(result, ignore_index=True)
+                result = pd.concat(result, ignore_index=True, copy=False, sort=False)
 
             elapsed = time.time() - start_time
 
             if not result.empty:
-                # Clean up columns - remove InfluxDB metadata columns we don't need
-                cols_to_drop = ['result', 'table', '_start', '_stop', '_measurement']
-                result = result.drop(columns=[c for c in cols_to_drop if c in result.columns], errors='ignore')
+                # Metadata columns are dropped in Flux; only the client's annotation columns remain
+                result = result.drop(columns=['result', 'table'], errors='ignore')
 
                 logger.info(f"query_metrics_wide: {len(result)} rows, {len(result.columns)} columns in {elapsed:.2f}s")
-            else:
-                logger.warning(f"query_metrics_wide: No data returned for {time_range}")
+                self._cache_put(cache_key, result)
+                return result.copy()
 
+            logger.warning(f"query_metrics_wide: No data returned for {time_range}")
             return result
 
         except Exception as e:
@@ -296,36 +636,46 @@ class HeatPumpDataQuery:
     def get_latest_values(self) -> Dict[str, Any]:
         """Get latest values for all metrics
 
-        OPTIMIZED: Uses vectorized set_index instead of iterrows()
+        OPTIMIZED: Streams the (one per metric) records into the dict, no DataFrame
+        OPTIMIZED: Scans the last 5 minutes first (the collector writes every 30s);
+        only metrics without a sample there are looked up over the last hour, and
+        that second query is skipped when every register already has a value
+        OPTIMIZED: Cached for _QUERY_CACHE_TTL seconds (one collector interval), so
+        the several callers of one dashboard refresh share one query
         """
-        try:
-            query = f'''
-                from(bucket: "{self.bucket}")
-                    |> range(start: -1h)
-                    |> filter(fn: (r) => r._measurement == "heatpump")
-                    |> group(columns: ["name"])
-                    |> last()
-            '''
-
-            result = self.query_api.query_data_frame(query)
-
-            if isinstance(result, list):
-                result = pd.concat(result, ignore_index=True)
+        cached = self._cache_get(('get_latest_values',))
+        if cached is not None:
+            return {name: dict(values) for name, values in cached.items()}
 
+        try:
             # Values are already converted by the collector before storing to DB
             latest = {}
-            if not result.empty:
-                # Vectorized: convert to dict directly without iterrows()
-                result = result.set_index('name')
-                for metric_name in result.index:
-                    row = result.loc[metric_name]
-                    latest[metric_name] = {
-                        'value': row['_value'],
-                        'unit': row.get('unit', '') if hasattr(row, 'get') else '',
-                        'time': row['_time']
+            for lookback in ('5m', '1h'):
+                if lookback == '1h' and latest and self._register_names <= latest.keys():
+                    break
+
+                # Metrics already found in the narrow window are excluded from the wide one
+                # (their 5m last() is also their 1h last()); slow/on-change metrics are kept
+                exclude = ''.join(f' and r.name != "{name}"' for name in sorted(latest))
+                query = f'''
+                    from(bucket: "{self.bucket}")
+                        |> range(start: -{lookback})
+                        |> filter(fn: (r) => r._measurement == "heatpump"{exclude})
+                        |> group(columns: ["name"])
+                        |> last(){self._FLUX_KEEP}
+                '''
+
+                # One row per metric: stream the records straight into the dict, no DataFrame
+                for record in self.query_api.query_stream(query):
+                    latest[record['name']] = {
+                        'value': record.get_value(),
+                        'unit': record.values.get('unit', ''),
+                        'time': record.get_time()
                     }
 
-            return latest
+            if latest:
+                self._cache_put(('get_latest_values',), latest)
+            return {name: dict(values) for name, values in latest.items()}
 
         except Exception as e:
             logger.error(f"Error getting latest values: {e}")
@@ -334,62 +684,38 @@ class HeatPumpDataQuery:
     def get_min_max_values(self, time_range: str = '24h') -> Dict[str, Dict[str, float]]:
         """Get MIN, MAX and MEAN values for all metrics over the specified time range
 
-        OPTIMIZED: Uses vectorized dict conversion instead of iterrows()
+        OPTIMIZED: min, max and mean are computed in one Flux union (one round-trip
+        instead of three), each stream tagged with an "agg" column
+        OPTIMIZED: Cached for _QUERY_CACHE_TTL seconds per time_range
         """
-        try:
-            query_min = f'''
-                from(bucket: "{self.bucket}")
-                    |> range(start: -{time_range})
-                    |> filter(fn: (r) => r._measurement == "heatpump")
-                    |> group(columns: ["name"])
-                    |> min()
-            '''
+        cache_key = ('get_min_max_values', time_range)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return {name: dict(stats) for name, stats in cached.items()}
 
-            query_max = f'''
-                from(bucket: "{self.bucket}")
+        try:
+            query = f'''
+                data = from(bucket: "{self.bucket}")
                     |> range(start: -{time_range})
                     |> filter(fn: (r) => r._measurement == "heatpump")
                     |> group(columns: ["name"])
-                    |> max()
-            '''
 
-            query_mean = f'''
-                from(bucket: "{self.bucket}")
-                    |> range(start: -{time_range})
-                    |> filter(fn: (r) => r._measurement == "heatpump")
-                    |> group(columns: ["name"])
-                    |> mean()
+                union(tables: [
+                    data |> min() |> set(key: "agg", value: "min"),
+                    data |> max() |> set(key: "agg", value: "max"),
+                    data |> mean() |> set(key: "agg", value: "avg")
+                ])
+                    |> keep(columns: ["name", "agg", "_value"])
             '''
 
-            result_min = self.query_api.query_data_frame(query_min)
-            result_max = self.query_api.query_data_frame(query_max)
-            result_mean = self.query_api.query_data_frame(query_mean)
-
-            if isinstance(result_min, list):
-                result_min = pd.concat(result_min, ignore_index=True)
-            if isinstance(result_max, list):
-                result_max = pd.concat(result_max, ignore_index=True)
-            if isinstance(result_mean, list):
-                result_mean = pd.concat(result_mean, ignore_index=True)
-
-            # Vectorized: convert to dicts using set_index
-            min_dict = result_min.set_index('name')['_value'].to_dict() if not result_min.empty else {}
-            max_dict = result_max.set_index('name')['_value'].to_dict() if not result_max.empty else {}
-            avg_dict = result_mean.set_index('name')['_value'].to_dict() if not result_mean.empty else {}
-
-            # Combine into single dict
-            all_metrics = set(min_dict.keys()) | set(max_dict.keys()) | set(avg_dict.keys())
+            # A few rows per metric: stream the records straight into the dict, no DataFrame
             min_max = {}
-            for metric_name in all_metrics:
-                min_max[metric_name] = {}
-                if metric_name in min_dict:
-                    min_max[metric_name]['min'] = min_dict[metric_name]
-                if metric_name in max_dict:
-                    min_max[metric_name]['max'] = max_dict[metric_name]
-                if metric_name in avg_dict:
-                    min_max[metric_name]['avg'] = avg_dict[metric_name]
+            for record in self.query_api.query_stream(query):
+                min_max.setdefault(record['name'], {})[record['agg']] = record.get_value()
 
-            return min_max
+            if min_max:
+                self._cache_put(cache_key, min_max)
+            return {name: dict(stats) for name, stats in min_max.items()}
 
         except Exception as e:
             logger.error(f"Error getting min/max values: {e}")
@@ -401,26 +727,21 @@ class HeatPumpDataQuery:
 
         OPTIMIZED: Avoids 3 separate InfluxDB queries by using batch data
         This saves ~2-3s of load time when min/max values are needed
+        OPTIMIZED: One groupby().agg() instead of a boolean mask per metric
         """
         try:
             if df.empty:
                 return {}
 
-            min_max = {}
-
-            # Group by metric name and calculate statistics
-            for metric_name in df['name'].unique():
-                metric_df = df[df['name'] == metric_name]
-                values = metric_df['_value'].dropna()
+            # Single hashed groupby pass for all metrics (NaN skipped, all-NaN metrics dropped)
+            stats = df.groupby('name', sort=False, observed=True)['_value'].agg(['min', 'max', 'mean', 'count'])
+            stats = stats[stats['count'] > 0]
 
-                if len(values) > 0:
-                    min_max[metric_name] = {
-                        'min': float(values.min()),
-                        'max': float(values.max()),
-                        'avg': float(values.mean())
-                    }
-
-            return min_max
+            return {
+                metric_name: {'min': float(vmin), 'max': float(vmax), 'avg': float(vmean)}
+                for metric_name, vmin, vmax, vmean in zip(
+                    stats.index, stats['min'].to_numpy(), stats['max'].to_numpy(), stats['mean'].to_numpy())
+            }
 
         except Exception as e:
             logger.error(f"Error calculating min/max from dataframe: {e}")
@@ -431,26 +752,21 @@ class HeatPumpDataQuery:
         Get latest values for all metrics from pre-fetched DataFrame
 
         OPTIMIZED: Avoids separate InfluxDB query by using batch data
-        Takes the most recent row for each metric
+        Takes the most recent row for each metric (drop_duplicates keep='last')
         """
         try:
             if df.empty:
                 return {}
 
-            latest = {}
-
-            # Get the last row for each metric (data is already sorted by time in query)
-            for metric_name in df['name'].unique():
-                metric_df = df[df['name'] == metric_name].sort_values('_time')
-                if not metric_df.empty:
-                    last_row = metric_df.iloc[-1]
-                    latest[metric_name] = {
-                        'value': last_row['_value'],
-                        'unit': last_row.get('unit', ''),
-                        'time': last_row['_time']
-                    }
+            # Last row per metric: one time sort + hash dedup instead of a sort per metric
+            last_rows = self._sort_by_time(df).drop_duplicates('name', keep='last')
+            units = last_rows['unit'] if 'unit' in last_rows.columns else [''] * len(last_rows)
 
-            return latest
+            return {
+                metric_name: {'value': float(value), 'unit': unit, 'time': timestamp}
+                for metric_name, value, unit, timestamp in zip(
+                    last_rows['name'], last_rows['_value'], units, last_rows['_time'])
+            }
 
         except Exception as e:
             logger.error(f"Error getting latest values from dataframe: {e}")
@@ -461,6 +777,7 @@ class HeatPumpDataQuery:
         Get current alarm status from pre-fetched DataFrame
 
         OPTIMIZED: Avoids separate InfluxDB query by using batch data
+        OPTIMIZED: One sort + drop_duplicates for the current values, one mask for the alarm time
         """
         try:
             # Get latest alarm values from batch data
@@ -468,26 +785,25 @@ class HeatPumpDataQuery:
             alarm_code = 0
 
             if 'name' in df.columns:
-                alarm_status_df = df[df['name'] == 'alarm_status']
-                if not alarm_status_df.empty:
-                    alarm_status = alarm_status_df.sort_values('_time').iloc[-1]['_value']
-
-                alarm_code_df = df[df['name'] == 'alarm_code']
-                if not alarm_code_df.empty:
-                    alarm_code = int(alarm_code_df.sort_values('_time').iloc[-1]['_value'])
+                # One time sort; the last row per metric gives the current values
+                df = self._sort_by_time(df)
+                latest = df.drop_duplicates('name', keep='last').set_index('name')['_value']
+                if 'alarm_status' in latest.index:
+                    alarm_status = float(latest['alarm_status'])
+                if 'alarm_code' in latest.index:
+                    alarm_code = int(latest['alarm_code'])
 
             is_alarm = alarm_status > 0 or alarm_code > 0
 
             # Use brand-specific alarm codes
             alarm_description = self.alarm_codes.get(alarm_code, f"Okänd larmkod: {alarm_code}")
 
-            # Get alarm time if active (from the last alarm_code > 0)
+            # Get alarm time if active (from the last alarm_code > 0), one combined mask
             alarm_time = None
             if is_alarm and 'name' in df.columns:
-                alarm_code_df = df[df['name'] == 'alarm_code']
-                alarm_active = alarm_code_df[alarm_code_df['_value'] > 0]
+                alarm_active = df.loc[(df['name'] == 'alarm_code') & (df['_value'] > 0), '_time']
                 if not alarm_active.empty:
-                    alarm_time = alarm_active.sort_values('_time').iloc[-1]['_time']
+                    alarm_time = alarm_active.iloc[-1]
 
             return {
                 'is_alarm': is_alarm,
@@ -507,93 +823,77 @@ class HeatPumpDataQuery:
                 'alarm_status_raw': 0
             }
 
-    def get_event_log_from_df(self, df: pd.DataFrame, limit: int = 20) -> List[Dict[str, Any]]:
+    def get_event_log_from_df(self, df: pd.DataFrame, limit: int = 20,
+                              as_frame: bool = False) -> Union[List[Dict[str, Any]], pd.DataFrame]:
         """
         Get recent events (state changes) from pre-fetched DataFrame
 
         OPTIMIZED: Uses vectorized operations instead of iterrows() for 100x speedup
+        OPTIMIZED: One sort and one groupby instead of a boolean mask per metric
+
+        Args:
+            as_frame: Return a columnar DataFrame (see _events_frame) instead of a list of dicts
         """
         try:
             if df.empty:
-                return []
+                return self._events_frame([]) if as_frame else []
 
             events = []
 
-            # Binary status metrics (0/1 transitions)
-            binary_metrics = {
-                'compressor_status': ('Kompressor PÅ', 'Kompressor AV', '🔄', '⏸️', 'info', 'info'),
-                'brine_pump_status': ('Köldbärarpump PÅ', 'Köldbärarpump AV', '💧', '💧', 'info', 'info'),
-                'radiator_pump_status': ('Radiatorpump PÅ', 'Radiatorpump AV', '📡', '📡', 'info', 'info'),
-                'switch_valve_status': ('Varmvattencykel START', 'Varmvattencykel STOPP', '🚿', '🚿', 'info', 'info'),
-                'alarm_status': ('Larm aktiverat', 'Larm återställt', '⚠️', '✅', 'danger', 'success'),
-            }
+            # Sort once and partition once; groups keep the time order
+            groups = dict(list(self._sort_by_time(df).groupby('name', observed=True, sort=False)))
 
-            # Process binary metrics with vectorized operations
-            for metric_name, (on_msg, off_msg, icon_on, icon_off, type_on, type_off) in binary_metrics.items():
-                metric_df = df[df['name'] == metric_name].copy()
-                if metric_df.empty:
+            # Binary status metrics (0/1 transitions), then aux heater and alarm code (values in the text)
+            for metric_name in self._BINARY_EVENT_METRICS + ('additional_heat_percent', 'alarm_code'):
+                metric_df = groups.get(metric_name)
+                if metric_df is None or len(metric_df) < 2:
                     continue
 
-                metric_df = metric_df.sort_values('_time')
-                metric_df['prev_value'] = metric_df['_value'].shift(1)
-
-                # Vectorized: find rising edges (0→1)
-                rising = (metric_df['_value'] > 0) & (metric_df['prev_value'] == 0) & metric_df['prev_value'].notna()
-                for ts in metric_df.loc[rising, '_time']:
-                    events.append({'time': ts, 'event': on_msg, 'type': type_on, 'icon': icon_on})
-
-                # Vectorized: find falling edges (1→0)
-                falling = (metric_df['_value'] == 0) & (metric_df['prev_value'] > 0) & metric_df['prev_value'].notna()
-                for ts in metric_df.loc[falling, '_time']:
-                    events.append({'time': ts, 'event': off_msg, 'type': type_off, 'icon': icon_off})
-
-            # Additional heat percent - special handling for percentage changes
-            aux_df = df[df['name'] == 'additional_heat_percent'].copy()
-            if not aux_df.empty:
-                aux_df = aux_df.sort_values('_time')
-                aux_df['prev_value'] = aux_df['_value'].shift(1)
-
-                # Rising: 0→>0
-                rising = (aux_df['_value'] > 0) & (aux_df['prev_value'] == 0) & aux_df['prev_value'].notna()
-                for ts, val in zip(aux_df.loc[rising, '_time'], aux_df.loc[rising, '_value']):
-                    events.append({'time': ts, 'event': f'Tillsattsvärme PÅ ({int(val)}%)', 'type': 'warning', 'icon': '🔥'})
-
-                # Falling: >0→0
-                falling = (aux_df['_value'] == 0) & (aux_df['prev_value'] > 0) & aux_df['prev_value'].notna()
-                for ts in aux_df.loc[falling, '_time']:
-                    events.append({'time': ts, 'event': 'Tillsattsvärme AV', 'type': 'info', 'icon': '🔥'})
-
-                # Significant change: both >0 and |delta| > 10
-                significant = (aux_df['_value'] > 0) & (aux_df['prev_value'] > 0) & \
-                              (abs(aux_df['_value'] - aux_df['prev_value']) > 10) & aux_df['prev_value'].notna()
-                for ts, val in zip(aux_df.loc[significant, '_time'], aux_df.loc[significant, '_value']):
-                    events.append({'time': ts, 'event': f'Tillsattsvärme ändrad till {int(val)}%', 'type': 'warning', 'icon': '🔥'})
-
-            # Alarm code - special handling for alarm descriptions
-            alarm_df = df[df['name'] == 'alarm_code'].copy()
-            if not alarm_df.empty:
-                alarm_df = alarm_df.sort_values('_time')
-                alarm_df['prev_value'] = alarm_df['_value'].shift(1)
-
-                # Rising: alarm triggered
-                rising = (alarm_df['_value'] > 0) & (alarm_df['prev_value'] == 0) & alarm_df['prev_value'].notna()
-                for ts, code in zip(alarm_df.loc[rising, '_time'], alarm_df.loc[rising, '_value']):
-                    alarm_desc = self.alarm_codes.get(int(code), f"Kod {int(code)}")
-                    events.append({'time': ts, 'event': f'LARM - {alarm_desc}', 'type': 'danger', 'icon': '⚠️'})
-
-                # Falling: alarm cleared
-                falling = (alarm_df['_value'] == 0) & (alarm_df['prev_value'] > 0) & alarm_df['prev_value'].notna()
-                for ts in alarm_df.loc[falling, '_time']:
-                    events.append({'time': ts, 'event': 'Larm återställt', 'type': 'success', 'icon': '✅'})
-
-            # Sort by time (newest first) and limit
-            events = sorted(events, key=lambda x: x['time'], reverse=True)[:limit]
-
-            return events
+                times = metric_df['_time'].array
+                values = metric_df['_value'].to_numpy(dtype=float)
+
+                events.extend(self._metric_events(metric_name, times, values, limit=limit))
+
+            # Newest `limit` events, newest first (partial selection instead of a full sort)
+            events = heapq.nlargest(limit, events, key=itemgetter(0))
+            events = [self._event_dict(event) for event in events]
+
+            return self._events_frame(events) if as_frame else events
 
         except Exception as e:
             logger.error(f"Error getting event log from dataframe: {e}")
-            return []
+            return self._events_frame([]) if as_frame else []
+
+    # Candidate forward/return sensor pairs for COP, in order of preference
+    _COP_SENSOR_PAIRS = (
+        ('heat_carrier_forward', 'heat_carrier_return'),
+        ('radiator_forward', 'radiator_return'),
+    )
+    _COP_SENSOR_COLUMNS = tuple(col for pair in _COP_SENSOR_PAIRS for col in pair)
+
+    @classmethod
+    def _select_cop_sensors(cls, means: Dict[str, float]) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Forward/return columns for the COP temperature delta
+
+        Prefers heat_carrier (IVT uses these, radiator sensors may be faulty) when
+        both columns exist and the forward mean is valid (> 0; IVT reports -48°C
+        when the sensor is missing), else radiator under the same rule.
+        Decided once per data set, so calculate_cop_from_pivot and
+        query_cop_intervals always pick the same pair.
+
+        Args:
+            means: Mean value per available sensor column
+
+        Returns:
+            (forward_col, return_col), or (None, None) if no pair is valid
+        """
+        for forward_col, return_col in cls._COP_SENSOR_PAIRS:
+            if forward_col in means and return_col in means and means[forward_col] > 0:
+                logger.debug("_select_cop_sensors: Using %s/%s (mean forward: %.1f°C)",
+                             forward_col, return_col, means[forward_col])
+                return forward_col, return_col
+        return None, None
 
     def calculate_cop_from_pivot(self, df_pivot: pd.DataFrame, interval_minutes: int = 15) -> pd.DataFrame:
         """
@@ -618,52 +918,43 @@ class HeatPumpDataQuery:
 
             logger.debug(f"calculate_cop_from_pivot: Input shape {df_pivot.shape}, columns: {list(df_pivot.columns)}")
 
-            # Make a copy to avoid modifying original
-            df = df_pivot.copy()
+            # Work on the columns the COP calculation reads, not a copy of the whole wide frame.
+            # reindex() returns a new, independent frame, so the caller's df_pivot is never modified
+            cop_cols = ['radiator_forward', 'radiator_return', 'power_consumption', 'compressor_status']
+            available_cols = [c for c in cop_cols if c in df_pivot.columns]
+            cols_needed = available_cols + [c for c in ('heat_carrier_forward', 'heat_carrier_return') if c in df_pivot.columns]
+            df = df_pivot.reindex(columns=[c for c in ['_time'] + cols_needed if c in df_pivot.columns])
 
             # Ensure _time is datetime
             if '_time' in df.columns and not pd.api.types.is_datetime64_any_dtype(df['_time']):
-                df['_time'] = pd.to_datetime(df['_time'])
+                df = df.assign(_time=pd.to_datetime(df['_time']))
 
             # Check if data needs re-pivoting (InfluxDB union+pivot doesn't work correctly)
             # If most values are NaN per column, data isn't properly aligned
-            cop_cols = ['radiator_forward', 'radiator_return', 'power_consumption', 'compressor_status']
-            available_cols = [c for c in cop_cols if c in df.columns]
             if available_cols:
-                avg_fill_rate = sum(df[c].notna().sum() for c in available_cols) / (len(df) * len(available_cols))
+                avg_fill_rate = float(df[available_cols].notna().to_numpy().mean())
                 if avg_fill_rate < 0.5:  # Less than 50% fill rate suggests unpivoted data
                     logger.info(f"calculate_cop_from_pivot: Data not properly pivoted (fill rate: {avg_fill_rate:.1%}), re-pivoting...")
-                    # Group by time and aggregate - this aligns all metrics to same timestamp
-                    numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-                    agg_dict = {col: 'mean' for col in numeric_cols if col in df.columns}
+                    # Group by time and aggregate - this aligns all metrics to same timestamp.
+                    # Only the columns the COP calculation reads (numeric ones) are aggregated
+                    numeric_cols = set(df[cols_needed].select_dtypes(include=[np.number]).columns)
                     # Status columns should use 'last' not 'mean'
-                    for status_col in ['compressor_status', 'brine_pump_status', 'radiator_pump_status', 'switch_valve_status']:
-                        if status_col in agg_dict:
-                            agg_dict[status_col] = 'last'
+                    agg_dict = {col: 'last' if col.endswith('_status') else 'mean'
+                                for col in cols_needed if col in numeric_cols}
                     if agg_dict:
-                        df = df.groupby('_time').agg(agg_dict).reset_index()
+                        # One groupby, one aggregate per column, assembled from the numpy results
+                        # (no dict-agg/reset_index machinery, contiguous columns for the COP math)
+                        grouped = df.groupby('_time', sort=True)
+                        columns = {col: grouped[col].agg(fn) for col, fn in agg_dict.items()}
+                        times = next(iter(columns.values())).index
+                        df = pd.DataFrame({'_time': times, **{col: agg.to_numpy() for col, agg in columns.items()}})
                         logger.info(f"calculate_cop_from_pivot: Re-pivoted to {len(df)} rows")
 
-            # Calculate temperature deltas
-            # Prefer heat_carrier if available and valid (IVT uses these, radiator sensors may be faulty)
-            forward_col = None
-            return_col = None
-
-            if 'heat_carrier_forward' in df.columns and 'heat_carrier_return' in df.columns:
-                hc_forward_mean = df['heat_carrier_forward'].mean()
-                if hc_forward_mean > 0:  # Valid heat carrier data (not -48°C)
-                    forward_col = 'heat_carrier_forward'
-                    return_col = 'heat_carrier_return'
-                    logger.debug(f"calculate_cop_from_pivot: Using heat_carrier temps (mean forward: {hc_forward_mean:.1f}°C)")
-
-            # Fall back to radiator if heat_carrier not valid
-            if forward_col is None:
-                if 'radiator_forward' in df.columns and 'radiator_return' in df.columns:
-                    rad_forward_mean = df['radiator_forward'].mean()
-                    if rad_forward_mean > 0:  # Valid radiator data
-                        forward_col = 'radiator_forward'
-                        return_col = 'radiator_return'
-                        logger.debug(f"calculate_cop_from_pivot: Using radiator temps (mean forward: {rad_forward_mean:.1f}°C)")
+            # Calculate temperature deltas (sensor pair chosen from the column means,
+            # shared with query_cop_intervals)
+            forward_col, return_col = self._select_cop_sensors({
+                col: df[col].mean() for col in self._COP_SENSOR_COLUMNS if col in df.columns
+            })
 
             if forward_col is None or return_col is None:
                 logger.warning("calculate_cop_from_pivot: No valid forward/return temperature data")
@@ -676,10 +967,6 @@ class HeatPumpDataQuery:
 
             df['radiator_delta'] = df[forward_col] - df[return_col]
 
-            # Also copy the forward/return values with standard names for groupby later
-            df['radiator_forward'] = df[forward_col]
-            df['radiator_return'] = df[return_col]
-
             # Check what data we have
             has_power = 'power_consumption' in df.columns
             has_compressor = 'compressor_status' in df.columns
@@ -688,10 +975,18 @@ class HeatPumpDataQuery:
                 logger.warning("No power consumption data available for COP calculation")
                 return pd.DataFrame()
 
-            # Sort by time and calculate time differences
-            df = df.sort_values('_time').reset_index(drop=True)
-            df['time_diff_hours'] = df['_time'].diff().dt.total_seconds() / 3600
-            df['time_diff_hours'] = df['time_diff_hours'].fillna(0).clip(0, 1)  # Cap at 1 hour max
+            # Compressor never ran in the window (common overnight): every interval would
+            # have zero heat/electricity and no COP, so skip the pipeline
+            if has_compressor and not (df['compressor_status'].to_numpy() > 0).any():
+                logger.info("calculate_cop_from_pivot: Compressor not running in period, no COP intervals")
+                return pd.DataFrame()
+
+            # Sort by time and calculate time differences (Flux already returns wide data
+            # sorted, so the sort and its full-frame copy are usually skipped)
+            if not df['_time'].is_monotonic_increasing:
+                df = df.sort_values('_time', ignore_index=True)
+            time_diff_hours = _time_diff_hours(_time_ns(df))
+            df['time_diff_hours'] = np.clip(time_diff_hours, 0, 1)  # Cap at 1 hour max
 
             # Valid mask: compressor running and valid data
             if has_compressor:
@@ -705,74 +1000,79 @@ class HeatPumpDataQuery:
                 (df['power_consumption'].fillna(0) > 100)
             )
 
-            df['heat_kwh'] = 0.0
-            df['elec_kwh'] = 0.0
+            # Whole-column np.where instead of masked .loc writes (0 outside valid samples)
+            valid = valid_mask.to_numpy()
+            hours = df['time_diff_hours'].to_numpy()
 
             # Heat output in kWh = (delta_T × flow_factor) × time_hours
-            df.loc[valid_mask, 'heat_kwh'] = (
-                df.loc[valid_mask, 'radiator_delta'] * self.cop_flow_factor *
-                df.loc[valid_mask, 'time_diff_hours']
-            )
+            df['heat_kwh'] = np.where(valid, df['radiator_delta'].to_numpy() * self.cop_flow_factor * hours, 0.0)
 
             # Electrical input in kWh = power_W / 1000 × time_hours
-            df.loc[valid_mask, 'elec_kwh'] = (
-                df.loc[valid_mask, 'power_consumption'] / 1000.0 *
-                df.loc[valid_mask, 'time_diff_hours']
-            )
-
-            # Create interval groups (e.g., 15-minute intervals)
-            # Use 'T' suffix for broader pandas compatibility
-            df['interval'] = df['_time'].dt.floor(f'{interval_minutes}T')
+            df['elec_kwh'] = np.where(valid, df['power_consumption'].to_numpy() / 1000.0 * hours, 0.0)
 
             logger.debug(f"calculate_cop_from_pivot: Valid samples: {valid_mask.sum()}/{len(df)}, total heat: {df['heat_kwh'].sum():.2f} kWh, total elec: {df['elec_kwh'].sum():.2f} kWh")
 
-            # Aggregate by interval: sum heat and electricity
-            interval_df = df.groupby('interval').agg({
+            # Aggregate by interval (e.g., 15-minute intervals): sum heat and electricity.
+            # resample() bins the sorted time index directly (no floor column, no hashing);
+            # origin='epoch' gives the same bins as dt.floor, and bins without samples are dropped
+            resampler = df.set_index('_time').resample(f'{interval_minutes}min', origin='epoch')
+            interval_df = resampler.agg({
                 'heat_kwh': 'sum',
                 'elec_kwh': 'sum',
-                'radiator_forward': 'mean',
-                'radiator_return': 'mean',
+                forward_col: 'mean',
+                return_col: 'mean',
                 'power_consumption': 'mean'
-            }).reset_index()
-
-            # Calculate interval COP = Σ heat / Σ electricity
-            interval_df['estimated_cop'] = None
-            valid_intervals = interval_df['elec_kwh'] > 0.01  # At least some electricity used
-
-            interval_df.loc[valid_intervals, 'estimated_cop'] = (
-                interval_df.loc[valid_intervals, 'heat_kwh'] /
-                interval_df.loc[valid_intervals, 'elec_kwh']
-            )
-
-            # Log COP for diagnostics
-            if valid_intervals.any():
-                raw_cop_mean = interval_df.loc[valid_intervals, 'estimated_cop'].mean()
-                raw_cop_max = interval_df.loc[valid_intervals, 'estimated_cop'].max()
-                logger.info(f"calculate_cop_from_pivot: COP - mean: {raw_cop_mean:.2f}, max: {raw_cop_max:.2f}")
+            })
+            interval_df = interval_df[resampler.size().to_numpy() > 0].reset_index()
 
-            # No clamping - show real calculated values for proper flow_factor calibration
+            # Selected sensors under the standard names (no duplicated full-length columns)
+            interval_df = interval_df.rename(columns={forward_col: 'radiator_forward', return_col: 'radiator_return'})
 
-            # Calculate cumulative/seasonal COP
-            interval_df['cumulative_heat'] = interval_df['heat_kwh'].cumsum()
-            interval_df['cumulative_elec'] = interval_df['elec_kwh'].cumsum()
-            interval_df['seasonal_cop'] = None
+            return self._finalize_cop_intervals(interval_df)
+        except Exception as e:
+            logger.error(f"Error calculating COP from pivot: {e}", exc_info=True)
+            return pd.DataFrame()
 
-            cumulative_valid = interval_df['cumulative_elec'] > 0.1
-            interval_df.loc[cumulative_valid, 'seasonal_cop'] = (
-                interval_df.loc[cumulative_valid, 'cumulative_heat'] /
-                interval_df.loc[cumulative_valid, 'cumulative_elec']
-            )
+    def _finalize_cop_intervals(self, interval_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Add interval COP and cumulative/seasonal COP to per-interval energy sums
 
-            # Rename interval column to _time for compatibility
-            interval_df = interval_df.rename(columns={'interval': '_time'})
+        Shared by the client-side (calculate_cop_from_pivot) and InfluxDB-side
+        (query_cop_intervals) aggregation paths.
 
-            valid_cop_count = interval_df['estimated_cop'].notna().sum()
-            logger.info(f"calculate_cop_from_pivot: Generated {len(interval_df)} intervals, {valid_cop_count} with valid COP")
+        Args:
+            interval_df: DataFrame with _time, heat_kwh and elec_kwh per interval
 
-            return interval_df
-        except Exception as e:
-            logger.error(f"Error calculating COP from pivot: {e}", exc_info=True)
-            return pd.DataFrame()
+        Returns:
+            DataFrame with estimated_cop, cumulative_heat, cumulative_elec and seasonal_cop added
+        """
+        # Calculate interval COP = Σ heat / Σ electricity (NaN where too little electricity was used)
+        valid_intervals = interval_df['elec_kwh'] > 0.01  # At least some electricity used
+        heat = interval_df['heat_kwh'].to_numpy(dtype=float)
+        elec = interval_df['elec_kwh'].to_numpy(dtype=float)
+        interval_df['estimated_cop'] = np.where(valid_intervals, heat / np.where(valid_intervals, elec, 1.0), np.nan)
+
+        # Log COP for diagnostics
+        if valid_intervals.any():
+            raw_cop_mean = interval_df.loc[valid_intervals, 'estimated_cop'].mean()
+            raw_cop_max = interval_df.loc[valid_intervals, 'estimated_cop'].max()
+            logger.info(f"_finalize_cop_intervals: COP - mean: {raw_cop_mean:.2f}, max: {raw_cop_max:.2f}")
+
+        # No clamping - show real calculated values for proper flow_factor calibration
+
+        # Calculate cumulative/seasonal COP on the numpy arrays (NaN until 0.1 kWh electricity is used)
+        cumulative_heat = np.cumsum(heat)
+        cumulative_elec = np.cumsum(elec)
+        cumulative_valid = cumulative_elec > 0.1
+        interval_df['cumulative_heat'] = cumulative_heat
+        interval_df['cumulative_elec'] = cumulative_elec
+        interval_df['seasonal_cop'] = np.where(
+            cumulative_valid, cumulative_heat / np.where(cumulative_valid, cumulative_elec, 1.0), np.nan)
+
+        valid_cop_count = interval_df['estimated_cop'].notna().sum()
+        logger.info(f"_finalize_cop_intervals: Generated {len(interval_df)} intervals, {valid_cop_count} with valid COP")
+
+        return interval_df
 
     def calculate_cop_from_df(self, df: pd.DataFrame, interval_minutes: int = 15) -> pd.DataFrame:
         """
@@ -789,30 +1089,21 @@ class HeatPumpDataQuery:
             if df.empty:
                 return pd.DataFrame()
 
-            # Filter to only COP-related metrics
-            cop_metrics = [
-                'radiator_forward',
-                'radiator_return',
-                'heat_carrier_forward',  # IVT alternative
-                'heat_carrier_return',   # IVT alternative
-                'brine_in_evaporator',
-                'brine_out_condenser',
-                'power_consumption',
-                'compressor_status'
-            ]
-
-            df_filtered = df[df['name'].isin(cop_metrics)].copy()
+            # Filter to only COP-related metrics (on a categorical name: a code lookup)
+            df_filtered = df[df['name'].isin(self._COP_METRICS)]
 
             if df_filtered.empty:
                 return pd.DataFrame()
 
-            # Pivot to get each metric as a column
-            df_pivot = df_filtered.pivot_table(
-                index='_time',
-                columns='name',
-                values='_value',
-                aggfunc='mean'
-            ).reset_index()
+            # Pivot to get each metric as a column: groupby-mean + unstack, i.e. pivot_table(aggfunc='mean')
+            # without its generic machinery (NaN means dropped first, as pivot_table's dropna does)
+            df_pivot = (
+                df_filtered.groupby(['_time', 'name'], observed=True)['_value']
+                .mean()
+                .dropna()
+                .unstack('name')
+                .reset_index()
+            )
 
             # Delegate to the pivoted version
             return self.calculate_cop_from_pivot(df_pivot, interval_minutes)
@@ -821,6 +1112,151 @@ class HeatPumpDataQuery:
             logger.error(f"Error calculating COP from dataframe: {e}")
             return pd.DataFrame()
 
+    def query_cop_intervals(self, time_range: str = '24h', aggregation_window: Optional[str] = None,
+                            interval_minutes: int = 15) -> Optional[pd.DataFrame]:
+        """
+        Query per-interval heat/electric energy with the interval sums done in InfluxDB
+
+        Same model as calculate_cop_from_pivot, but map() computes heat_kwh/elec_kwh
+        per sample and window() |> reduce() sums them per interval server-side,
+        so only one row per interval crosses the wire. The frame-level decisions
+        of calculate_cop_from_pivot (sensor pair from the column means, compressor
+        and power presence) come from a small pre-query of per-metric statistics
+        and are rendered into the main query, so both paths give the same intervals.
+
+        Args:
+            time_range: Time period (e.g., '24h', '7d')
+            aggregation_window: Sample aggregation before integration (None = automatic)
+            interval_minutes: COP interval (default 15 min)
+
+        Returns:
+            DataFrame with _time, heat_kwh, elec_kwh, radiator_forward, radiator_return
+            and power_consumption per interval (empty when there is no COP data),
+            or None if the query failed
+        """
+        try:
+            if aggregation_window is None:
+                aggregation_window = self._get_cop_aggregation_window(time_range)
+
+            value_data = self._aggregate_stream(
+                list(self._COP_SENSOR_COLUMNS) + ['power_consumption'],
+                time_range, aggregation_window, 'mean')
+            status_data = self._aggregate_stream(['compressor_status'], time_range, aggregation_window, 'last')
+
+            # Pre-query: mean per value metric and max of the compressor status, over the
+            # same aggregated samples the interval query integrates
+            stats_query = f'''
+                union(tables: [
+                    {value_data} |> group(columns: ["name"]) |> mean(),
+                    {status_data} |> group(columns: ["name"]) |> max()
+                ])
+                    |> keep(columns: ["name", "_value"])
+            '''
+            stats = {record['name']: record.get_value() for record in self.query_api.query_stream(stats_query)}
+
+            forward_col, return_col = self._select_cop_sensors(
+                {col: stats[col] for col in self._COP_SENSOR_COLUMNS if col in stats})
+            if forward_col is None:
+                logger.warning("query_cop_intervals: No valid forward/return temperature data")
+                return pd.DataFrame()
+            if 'power_consumption' not in stats:
+                logger.warning("No power consumption data available for COP calculation")
+                return pd.DataFrame()
+
+            # Like calculate_cop_from_pivot: with a compressor_status column, samples without
+            # a status count as off, and a compressor that never ran gives no intervals
+            has_compressor = 'compressor_status' in stats
+            if has_compressor and not stats['compressor_status'] > 0:
+                logger.info("query_cop_intervals: Compressor not running in period, no COP intervals")
+                return pd.DataFrame()
+            compressor_on = 'exists r.compressor_status and r.compressor_status > 0.0' if has_compressor else 'true'
+
+            # flow_factor is rendered as a float literal: an integer from config.yaml
+            # (flow_factor: 3) would make Flux reject float * int.
+            # Seconds since the previous row via difference() on the timestamp, so the
+            # first row is kept (with 0 hours) like _time_diff_hours, unlike elapsed()
+            query = f'''
+                value_data = {value_data}
+
+                status_data = {status_data}
+
+                union(tables: [value_data, status_data])
+                    |> keep(columns: ["_time", "name", "_value"])
+                    |> group()
+                    |> pivot(rowKey: ["_time"], columnKey: ["name"], valueColumn: "_value")
+                    |> sort(columns: ["_time"])
+                    |> map(fn: (r) => ({{r with time_diff: int(v: r._time)}}))
+                    |> difference(columns: ["time_diff"], keepFirst: true)
+                    |> map(fn: (r) => {{
+                        flow_factor = {float(self.cop_flow_factor)!r}
+                        hours = if not exists r.time_diff then 0.0
+                            else if r.time_diff > 3600000000000 then 1.0
+                            else float(v: r.time_diff) / 3600000000000.0
+                        valid = {compressor_on}
+                            and exists r.{forward_col} and exists r.{return_col} and exists r.power_consumption
+                            and r.{forward_col} - r.{return_col} > 0.5 and r.power_consumption > 100.0
+                        return {{
+                            _time: r._time,
+                            heat_kwh: if valid then (r.{forward_col} - r.{return_col}) * flow_factor * hours else 0.0,
+                            elec_kwh: if valid then r.power_consumption / 1000.0 * hours else 0.0,
+                            forward_sum: if exists r.{forward_col} then r.{forward_col} else 0.0,
+                            forward_n: if exists r.{forward_col} then 1.0 else 0.0,
+                            return_sum: if exists r.{return_col} then r.{return_col} else 0.0,
+                            return_n: if exists r.{return_col} then 1.0 else 0.0,
+                            power_sum: if exists r.power_consumption then r.power_consumption else 0.0,
+                            power_n: if exists r.power_consumption then 1.0 else 0.0,
+                        }}
+                    }})
+                    |> window(every: {interval_minutes}m)
+                    |> reduce(
+                        identity: {{heat_kwh: 0.0, elec_kwh: 0.0, forward_sum: 0.0, forward_n: 0.0,
+                                    return_sum: 0.0, return_n: 0.0, power_sum: 0.0, power_n: 0.0}},
+                        fn: (r, accumulator) => ({{
+                            heat_kwh: accumulator.heat_kwh + r.heat_kwh,
+                            elec_kwh: accumulator.elec_kwh + r.elec_kwh,
+                            forward_sum: accumulator.forward_sum + r.forward_sum,
+                            forward_n: accumulator.forward_n + r.forward_n,
+                            return_sum: accumulator.return_sum + r.return_sum,
+                            return_n: accumulator.return_n + r.return_n,
+                            power_sum: accumulator.power_sum + r.power_sum,
+                            power_n: accumulator.power_n + r.power_n,
+                        }}),
+                    )
+                    |> group()
+                    |> rename(columns: {{_start: "_time"}})
+                    |> drop(columns: ["_stop"])
+                    |> sort(columns: ["_time"])
+            '''
+
+            result = self.query_api.query_data_frame(query)
+
+            if isinstance(result, list):
+                result = pd.concat(result, ignore_index=True, copy=False, sort=False)
+
+            if result.empty:
+                return pd.DataFrame()
+
+            # Interval means of the display columns, each over its own samples (NaN when none).
+            # window() clamps the first window's _start to the range start: floor it to the
+            # interval grid, like resample(origin='epoch') in calculate_cop_from_pivot
+            interval_df = pd.DataFrame({
+                '_time': pd.to_datetime(result['_time']).dt.floor(f'{interval_minutes}min'),
+                'heat_kwh': result['heat_kwh'],
+                'elec_kwh': result['elec_kwh'],
+                'radiator_forward': result['forward_sum'] / result['forward_n'].where(result['forward_n'] > 0),
+                'radiator_return': result['return_sum'] / result['return_n'].where(result['return_n'] > 0),
+                'power_consumption': result['power_sum'] / result['power_n'].where(result['power_n'] > 0),
+            })
+
+            logger.debug("query_cop_intervals: %d intervals for %s (%s samples, %s/%s)",
+                         len(interval_df), time_range, aggregation_window, forward_col, return_col)
+
+            return interval_df
+
+        except Exception as e:
+            logger.error(f"Error querying COP intervals: {e}")
+            return None
+
     def calculate_cop(self, time_range: str = '24h') -> pd.DataFrame:
         """
         Calculate COP (Coefficient of Performance) over time
@@ -830,26 +1266,37 @@ class HeatPumpDataQuery:
 
         COP = Heat Output / Electrical Input
         Simplified calculation using temperature deltas
+
+        Interval sums are computed in InfluxDB (query_cop_intervals); falls back
+        to client-side aggregation when that query fails
+        OPTIMIZED: Cached per time_range (see _result_cache_ttl)
         """
-        try:
-            metrics = [
-                'radiator_forward',
-                'radiator_return',
-                'heat_carrier_forward',  # IVT alternative
-                'heat_carrier_return',   # IVT alternative
-                'brine_in_evaporator',
-                'brine_out_condenser',
-                'power_consumption',
-                'compressor_status'
-            ]
+        cache_key = ('calculate_cop', time_range)
+        cached = self._cache_get(cache_key, ttl=self._result_cache_ttl(time_range))
+        if cached is not None:
+            return cached.copy()
 
+        try:
             # Use finer aggregation for COP visualization (smoother charts)
             # 7d: 10m instead of 30m, 30d: 30m instead of 2h
             cop_aggregation = self._get_cop_aggregation_window(time_range)
-            df = self.query_metrics(metrics, time_range, aggregation_window=cop_aggregation)
 
-            # Use the optimized method
-            return self.calculate_cop_from_df(df)
+            # Interval sums computed in InfluxDB - only one row per interval is transferred
+            interval_df = self.query_cop_intervals(time_range, aggregation_window=cop_aggregation)
+            if interval_df is not None:
+                result = self._finalize_cop_intervals(interval_df) if not interval_df.empty else interval_df
+            else:
+                # Fall back to client-side aggregation of the samples, pivoted in InfluxDB
+                # (one request, no pandas pivot)
+                df_pivot = self.query_metrics_wide(sorted(self._COP_METRICS), time_range,
+                                                   aggregation_window=cop_aggregation)
+
+                # Use the optimized method
+                result = self.calculate_cop_from_pivot(df_pivot)
+
+            if not result.empty:
+                self._cache_put(cache_key, result)
+            return result.copy()
 
         except Exception as e:
             logger.error(f"Error calculating COP: {e}")
@@ -861,39 +1308,115 @@ class HeatPumpDataQuery:
 
         Uses finer granularity than batch queries for smoother visualization
         UPDATED: 10m for both 7d and 30d for consistent fine granularity
+        Looked up in _COP_AGG_WINDOWS (unknown formats give 5m)
         """
-        if time_range.endswith('h'):
-            hours = int(time_range[:-1])
-            if hours <= 1:
-                return "1m"
-            elif hours <= 6:
-                return "2m"
-            elif hours <= 24:
-                return "5m"
-            else:
-                return "10m"
-        elif time_range.endswith('d'):
-            days = int(time_range[:-1])
-            if days <= 1:
-                return "5m"
-            elif days <= 7:
-                return "10m"  # 7d: 10m aggregation (~1000 points)
-            elif days <= 30:
-                return "10m"  # 30d: 10m aggregation (~4320 points) - FINER!
-            else:
-                return "1h"
-        else:
-            return "5m"
-    
+        return _cop_aggregation_window(time_range)
+
+    def _query_energy_totals(self, time_range: str) -> Optional[Dict[str, float]]:
+        """
+        Compute energy totals for power_consumption in InfluxDB
+
+        Same model as the client-side calculation: each aggregated sample
+        contributes power × real time since the previous sample
+        (elapsed() |> map() |> sum()), so only three values cross the wire.
+
+        Returns:
+            Dict with total_kwh, avg_power and peak_power, or None if the query
+            failed or returned no data (failures are not cached)
+        """
+        cache_key = ('_query_energy_totals', time_range)
+        cached = self._cache_get(cache_key, ttl=self._result_cache_ttl(time_range))
+        if cached is not None:
+            return dict(cached)
+
+        try:
+            aggregation_window = self._get_aggregation_window(time_range)
+            power_data = self._aggregate_stream(['power_consumption'], time_range, aggregation_window, 'mean')
+
+            query = f'''
+                data = {power_data}
+                    |> keep(columns: ["_time", "_value"])
+
+                energy = data
+                    |> elapsed(unit: 1s)
+                    |> map(fn: (r) => ({{r with _value: r._value * float(v: r.elapsed) / 3600.0 / 1000.0}}))
+                    |> sum()
+                    |> set(key: "stat", value: "total_kwh")
+
+                avg_power = data
+                    |> mean()
+                    |> set(key: "stat", value: "avg_power")
+
+                peak_power = data
+                    |> max()
+                    |> drop(columns: ["_time"])
+                    |> set(key: "stat", value: "peak_power")
+
+                union(tables: [energy, avg_power, peak_power])
+            '''
+
+            result = self.query_api.query_data_frame(query)
+
+            if isinstance(result, list):
+                result = pd.concat(result, ignore_index=True, copy=False, sort=False)
+
+            if result.empty:
+                return None
+
+            stats = result.set_index('stat')['_value']
+            totals = {
+                'total_kwh': float(stats.get('total_kwh', 0.0)),
+                'avg_power': float(stats['avg_power']),
+                'peak_power': float(stats['peak_power'])
+            }
+            self._cache_put(cache_key, totals)
+            return dict(totals)
+
+        except Exception as e:
+            logger.warning(f"Energy totals query failed, using client-side calculation: {e}")
+            return None
+
     def calculate_energy_costs(self, time_range: str = '24h', price_per_kwh: float = 2.0) -> Dict[str, Any]:
         """
         Calculate energy consumption and costs
         
         KORREKT: Använder verklig tid mellan datapunkter
+        OPTIMIZED: Totals are computed in InfluxDB (_query_energy_totals, cached per
+        time_range), with the client-side calculation (calculate_energy_costs_from_df) as fallback
         """
         try:
-            df = self.query_metrics(['power_consumption'], time_range)
+            totals = self._query_energy_totals(time_range)
+
+            if totals is None:
+                df = self.query_metrics(['power_consumption'], time_range)
+                return self.calculate_energy_costs_from_df(df, price_per_kwh)
+
+            return self._energy_cost_result(totals['total_kwh'], totals['avg_power'],
+                                            totals['peak_power'], price_per_kwh)
             
+        except Exception as e:
+            logger.error(f"Error calculating energy costs: {e}")
+            return {
+                'total_kwh': 0,
+                'total_cost': 0,
+                'avg_power': 0,
+                'peak_power': 0
+            }
+
+    def calculate_energy_costs_from_df(self, df: pd.DataFrame, price_per_kwh: float = 2.0) -> Dict[str, Any]:
+        """
+        Calculate energy consumption and costs from pre-fetched data
+
+        KORREKT: Använder verklig tid mellan datapunkter
+
+        Args:
+            df: Long format data from query_metrics (only power_consumption rows are used)
+            price_per_kwh: Elpris (kr/kWh)
+        """
+        try:
+            if not df.empty:
+                df = df[df['name'] == 'power_consumption']
+
             if df.empty:
                 return {
                     'total_kwh': 0,
@@ -901,47 +1424,188 @@ class HeatPumpDataQuery:
                     'avg_power': 0,
                     'peak_power': 0
                 }
-            
-            df = df.sort_values('_time')
-            
+
+            df = self._sort_by_time(df)
+
             # Calculate time differences in hours - ANVÄNDER VERKLIG TID
-            df['time_diff_hours'] = df['_time'].diff().dt.total_seconds() / 3600
-            df['time_diff_hours'] = df['time_diff_hours'].fillna(0)
-            
+            time_diff_hours = _time_diff_hours(_time_ns(df))
+
             # Energy = Power (W) * Time (h) / 1000 (to get kWh)
-            df['energy_kwh'] = (df['_value'] * df['time_diff_hours']) / 1000
-            
-            total_kwh = df['energy_kwh'].sum()
-            total_cost = total_kwh * price_per_kwh
-            avg_power = df['_value'].mean()
-            peak_power = df['_value'].max()
-            
-            return {
-                'total_kwh': round(total_kwh, 2),
-                'total_cost': round(total_cost, 2),
-                'avg_power': round(avg_power, 0),
-                'peak_power': round(peak_power, 0)
-            }
-            
+            total_kwh = np.nansum(df['_value'].to_numpy() * time_diff_hours) / 1000
+
+            return self._energy_cost_result(total_kwh, df['_value'].mean(), df['_value'].max(), price_per_kwh)
+
         except Exception as e:
-            logger.error(f"Error calculating energy costs: {e}")
+            logger.error(f"Error calculating energy costs from df: {e}")
             return {
                 'total_kwh': 0,
                 'total_cost': 0,
                 'avg_power': 0,
                 'peak_power': 0
             }
+
+    @staticmethod
+    def _energy_cost_result(total_kwh: float, avg_power: float, peak_power: float,
+                            price_per_kwh: float) -> Dict[str, Any]:
+        """Format energy totals as returned by calculate_energy_costs"""
+        total_cost = total_kwh * price_per_kwh
+
+        return {
+            'total_kwh': round(total_kwh, 2),
+            'total_cost': round(total_cost, 2),
+            'avg_power': round(float(avg_power), 0),
+            'peak_power': round(float(peak_power), 0)
+        }
     
+    @staticmethod
+    def _on_time_seconds(metric_df: pd.DataFrame) -> float:
+        """
+        Seconds a metric was ON (> 0), using the real time to the next sample
+
+        Vectorized: each sample's interval comes from np.diff on the timestamps.
+        The last sample is assumed to last as long as the interval before it.
+
+        Args:
+            metric_df: Time-sorted rows of a single metric
+        """
+        if len(metric_df) < 2:
+            return 0.0
+
+        values = metric_df['_value'].to_numpy()
+        dt_ns = np.diff(_time_ns(metric_df))
+
+        # Masked reduction: no temporary array of the selected intervals
+        on_ns = dt_ns.sum(where=values[:-1] > 0)
+        if values[-1] > 0:
+            on_ns += dt_ns[-1]
+        return float(on_ns) / 1e9
+
+    def _query_runtime_totals(self, time_range: str) -> Optional[tuple]:
+        """
+        Compute compressor / auxiliary heater runtime totals in InfluxDB
+
+        Same model as _on_time_seconds: a sample that is ON (> 0) counts for the
+        real time until the next sample, and the last sample for the interval
+        before it. An ordered reduce() walks each metric once server-side, so
+        one row per metric crosses the wire.
+
+        Returns:
+            (total_hours, compressor_seconds, compressor_starts, aux_seconds), or
+            None if the query failed or returned no data (failures are not cached)
+        """
+        cache_key = ('_query_runtime_totals', time_range)
+        cached = self._cache_get(cache_key, ttl=self._result_cache_ttl(time_range))
+        if cached is not None:
+            return cached
+
+        try:
+            metrics = ['compressor_status', 'additional_heat_percent']
+            aggregation_window = self._get_aggregation_window(time_range)
+            status_fields = self._status_fields_set
+
+            streams = {}
+            for metric in metrics:
+                streams.setdefault('last' if metric in status_fields else 'mean', []).append(metric)
+            data = [self._aggregate_stream(names, time_range, aggregation_window, fn) for fn, names in streams.items()]
+            if len(data) > 1:
+                data = f"union(tables: [{', '.join(data)}])"
+            else:
+                data = data[0]
+
+            query = f'''
+                {data}
+                    |> keep(columns: ["_time", "name", "_value"])
+                    |> reduce(
+                        identity: {{on_seconds: 0.0, last_interval: 0.0, starts: 0, samples: 0, first_time: 0, prev_time: 0, prev_on: false}},
+                        fn: (r, accumulator) => {{
+                            t = int(v: r._time)
+                            on = r._value > 0.0
+                            interval = if accumulator.samples > 0 then float(v: t - accumulator.prev_time) / 1000000000.0 else 0.0
+                            return {{
+                                on_seconds: if accumulator.prev_on then accumulator.on_seconds + interval else accumulator.on_seconds,
+                                last_interval: interval,
+                                starts: if accumulator.samples > 0 and on and not accumulator.prev_on then accumulator.starts + 1 else accumulator.starts,
+                                samples: accumulator.samples + 1,
+                                first_time: if accumulator.samples == 0 then t else accumulator.first_time,
+                                prev_time: t,
+                                prev_on: on,
+                            }}
+                        }},
+                    )
+            '''
+
+            result = self.query_api.query_data_frame(query)
+
+            if isinstance(result, list):
+                result = pd.concat(result, ignore_index=True, copy=False, sort=False)
+
+            if result.empty:
+                return None
+
+            rows = result.set_index('name')
+
+            def on_seconds(metric: str) -> float:
+                if metric not in rows.index:
+                    return 0.0
+                row = rows.loc[metric]
+                seconds = row['on_seconds']
+                # För sista datapunkten, anta samma intervall som föregående
+                if row['samples'] > 1 and row['prev_on']:
+                    seconds += row['last_interval']
+                return float(seconds)
+
+            total_hours = (rows['prev_time'].max() - rows['first_time'].min()) / 3.6e12
+            compressor_starts = int(rows.loc['compressor_status', 'starts']) if 'compressor_status' in rows.index else 0
+
+            totals = (total_hours, on_seconds('compressor_status'), compressor_starts, on_seconds('additional_heat_percent'))
+            self._cache_put(cache_key, totals)
+            return totals
+
+        except Exception as e:
+            logger.warning(f"Runtime totals query failed, using client-side calculation: {e}")
+            return None
+
     def calculate_runtime_stats(self, time_range: str = '24h') -> Dict[str, Any]:
         """
         Calculate runtime statistics for compressor and auxiliary heater
         
         KORREKT: Använder verklig tid mellan datapunkter
+        OPTIMIZED: Totals are computed in InfluxDB (_query_runtime_totals, cached per
+        time_range), with the client-side calculation (calculate_runtime_stats_from_df) as fallback
         """
         try:
-            metrics = ['compressor_status', 'additional_heat_percent']
-            df = self.query_metrics(metrics, time_range)
+            totals = self._query_runtime_totals(time_range)
+
+            if totals is None:
+                metrics = ['compressor_status', 'additional_heat_percent']
+                df = self.query_metrics(metrics, time_range)
+                return self.calculate_runtime_stats_from_df(df, time_range)
+
+            return self._runtime_result(*totals, time_range=time_range)
             
+        except Exception as e:
+            logger.error(f"Error calculating runtime stats: {e}")
+            return {
+                'compressor_runtime_hours': 0,
+                'compressor_runtime_percent': 0,
+                'compressor_starts': 0,
+                'aux_heater_runtime_hours': 0,
+                'aux_heater_runtime_percent': 0,
+                'total_hours': 0
+            }
+
+    def calculate_runtime_stats_from_df(self, df: pd.DataFrame, time_range: str = '24h') -> Dict[str, Any]:
+        """
+        Calculate runtime statistics from pre-fetched data
+
+        KORREKT: Använder verklig tid mellan datapunkter
+
+        Args:
+            df: Long format data from query_metrics (compressor_status and
+                additional_heat_percent rows are used; all rows define the period)
+            time_range: Tidsperiod (only used for logging)
+        """
+        try:
             if df.empty:
                 return {
                     'compressor_runtime_hours': 0,
@@ -951,91 +1615,48 @@ class HeatPumpDataQuery:
                     'aux_heater_runtime_percent': 0,
                     'total_hours': 0
                 }
-            
-            df = df.sort_values('_time')
-            
+
             # Beräkna total tidsperiod
-            total_seconds = (df['_time'].max() - df['_time'].min()).total_seconds()
-            total_hours = total_seconds / 3600
-            
-            if total_hours == 0:
-                return {
-                    'compressor_runtime_hours': 0,
-                    'compressor_runtime_percent': 0,
-                    'compressor_starts': 0,
-                    'aux_heater_runtime_hours': 0,
-                    'aux_heater_runtime_percent': 0,
-                    'total_hours': 0
-                }
-            
+            time_ns = _time_ns(df)
+            total_hours = (time_ns.max() - time_ns.min()) / 3.6e12
+
+            # Partition once; sorted subsets stay sorted
+            groups = dict(list(self._sort_by_time(df).groupby('name', observed=True, sort=False)))
+            empty = df.iloc[:0]
+
             # Kompressor runtime - ANVÄNDER VERKLIG TID
-            comp_df = df[df['name'] == 'compressor_status'].copy()
-            comp_runtime_seconds = 0
-            
-            if not comp_df.empty:
-                comp_df = comp_df.sort_values('_time')
-                
-                # Beräkna tiden för varje datapunkt baserat på nästa datapunkt
-                for i in range(len(comp_df) - 1):
-                    if comp_df.iloc[i]['_value'] > 0:  # Om kompressor är PÅ
-                        # Beräkna VERKLIG tid till nästa datapunkt
-                        time_diff = (comp_df.iloc[i + 1]['_time'] - comp_df.iloc[i]['_time']).total_seconds()
-                        comp_runtime_seconds += time_diff
-                
-                # För sista datapunkten, anta samma intervall som föregående
-                if len(comp_df) > 1 and comp_df.iloc[-1]['_value'] > 0:
-                    avg_interval = (comp_df.iloc[-1]['_time'] - comp_df.iloc[-2]['_time']).total_seconds()
-                    comp_runtime_seconds += avg_interval
-            
-            comp_runtime_hours = comp_runtime_seconds / 3600
-            comp_runtime_percent = (comp_runtime_hours / total_hours * 100) if total_hours > 0 else 0
+            comp_df = groups.get('compressor_status', empty)
+            comp_runtime_seconds = self._on_time_seconds(comp_df)
 
             # Count compressor starts (rising edges: 0→1 transitions)
             compressor_starts = 0
             if len(comp_df) > 1:
-                values = comp_df['_value'].values
-                for i in range(1, len(values)):
-                    if values[i] > 0 and values[i-1] <= 0:
-                        compressor_starts += 1
-            
+                values = comp_df['_value'].to_numpy()
+                compressor_starts = int(np.count_nonzero((values[1:] > 0) & (values[:-1] <= 0)))
+
             # Auxiliary heater runtime - ANVÄNDER VERKLIG TID
-            aux_df = df[df['name'] == 'additional_heat_percent'].copy()
-            aux_runtime_seconds = 0
-            
-            if not aux_df.empty:
-                aux_df = aux_df.sort_values('_time')
-                
-                # Beräkna tiden för varje datapunkt baserat på nästa datapunkt
-                for i in range(len(aux_df) - 1):
-                    if aux_df.iloc[i]['_value'] > 0:  # Om tillsats är PÅ
-                        # Beräkna VERKLIG tid till nästa datapunkt
-                        time_diff = (aux_df.iloc[i + 1]['_time'] - aux_df.iloc[i]['_time']).total_seconds()
-                        aux_runtime_seconds += time_diff
-                
-                # För sista datapunkten, anta samma intervall som föregående
-                if len(aux_df) > 1 and aux_df.iloc[-1]['_value'] > 0:
-                    avg_interval = (aux_df.iloc[-1]['_time'] - aux_df.iloc[-2]['_time']).total_seconds()
-                    aux_runtime_seconds += avg_interval
-            
-            aux_runtime_hours = aux_runtime_seconds / 3600
-            aux_runtime_percent = (aux_runtime_hours / total_hours * 100) if total_hours > 0 else 0
-            
-            logger.info(f"Runtime calculation for {time_range}:")
-            logger.info(f"  Total period: {total_hours:.2f} hours")
-            logger.info(f"  Compressor: {comp_runtime_hours:.2f}h ({comp_runtime_percent:.1f}%), {compressor_starts} starts")
-            logger.info(f"  Aux heater: {aux_runtime_hours:.2f}h ({aux_runtime_percent:.1f}%)")
+            aux_df = groups.get('additional_heat_percent', empty)
+            aux_runtime_seconds = self._on_time_seconds(aux_df)
 
+            return self._runtime_result(total_hours, comp_runtime_seconds, compressor_starts,
+                                        aux_runtime_seconds, time_range=time_range)
+
+        except Exception as e:
+            logger.error(f"Error calculating runtime stats from df: {e}")
             return {
-                'compressor_runtime_hours': round(comp_runtime_hours, 1),
-                'compressor_runtime_percent': round(comp_runtime_percent, 1),
-                'compressor_starts': compressor_starts,
-                'aux_heater_runtime_hours': round(aux_runtime_hours, 1),
-                'aux_heater_runtime_percent': round(aux_runtime_percent, 1),
-                'total_hours': round(total_hours, 1)
+                'compressor_runtime_hours': 0,
+                'compressor_runtime_percent': 0,
+                'compressor_starts': 0,
+                'aux_heater_runtime_hours': 0,
+                'aux_heater_runtime_percent': 0,
+                'total_hours': 0
             }
-            
-        except Exception as e:
-            logger.error(f"Error calculating runtime stats: {e}")
+
+    @staticmethod
+    def _runtime_result(total_hours: float, comp_runtime_seconds: float, compressor_starts: int,
+                        aux_runtime_seconds: float, time_range: str = '24h') -> Dict[str, Any]:
+        """Format runtime totals as returned by calculate_runtime_stats"""
+        if total_hours == 0:
             return {
                 'compressor_runtime_hours': 0,
                 'compressor_runtime_percent': 0,
@@ -1044,7 +1665,118 @@ class HeatPumpDataQuery:
                 'aux_heater_runtime_percent': 0,
                 'total_hours': 0
             }
+
+        comp_runtime_hours = comp_runtime_seconds / 3600
+        comp_runtime_percent = (comp_runtime_hours / total_hours * 100) if total_hours > 0 else 0
+
+        aux_runtime_hours = aux_runtime_seconds / 3600
+        aux_runtime_percent = (aux_runtime_hours / total_hours * 100) if total_hours > 0 else 0
+
+        logger.info(f"Runtime calculation for {time_range}:")
+        logger.info(f"  Total period: {total_hours:.2f} hours")
+        logger.info(f"  Compressor: {comp_runtime_hours:.2f}h ({comp_runtime_percent:.1f}%), {compressor_starts} starts")
+        logger.info(f"  Aux heater: {aux_runtime_hours:.2f}h ({aux_runtime_percent:.1f}%)")
+
+        return {
+            'compressor_runtime_hours': round(comp_runtime_hours, 1),
+            'compressor_runtime_percent': round(comp_runtime_percent, 1),
+            'compressor_starts': compressor_starts,
+            'aux_heater_runtime_hours': round(aux_runtime_hours, 1),
+            'aux_heater_runtime_percent': round(aux_runtime_percent, 1),
+            'total_hours': round(total_hours, 1)
+        }
     
+    def _query_cumulative_energy(self, time_range: str) -> Optional[pd.DataFrame]:
+        """
+        Running energy total (kWh) of power_consumption, integrated in InfluxDB
+
+        Same model as the client-side integration: each 1m sample contributes
+        power × real time since the previous sample, accumulated with
+        cumulativeSum(), so a cycle's energy is the difference at its bounds.
+
+        Returns:
+            DataFrame with _time and _value (cumulative kWh), or None if the query
+            failed or returned no data
+        """
+        try:
+            power_data = self._aggregate_stream(['power_consumption'], time_range, '1m', 'mean')
+
+            query = f'''{power_data}
+                    |> elapsed(unit: 1s)
+                    |> map(fn: (r) => ({{r with _value: r._value * float(v: r.elapsed) / 3600.0 / 1000.0}}))
+                    |> cumulativeSum()
+                    |> keep(columns: ["_time", "_value"])
+            '''
+
+            result = self.query_api.query_data_frame(query)
+
+            if isinstance(result, list):
+                result = pd.concat(result, ignore_index=True, copy=False, sort=False)
+
+            if result.empty:
+                return None
+
+            return result.sort_values('_time')
+
+        except Exception as e:
+            logger.warning(f"Cumulative energy query failed, using client-side integration: {e}")
+            return None
+
+    @staticmethod
+    def _find_hot_water_cycles(valve_df: pd.DataFrame, power_df: pd.DataFrame,
+                               min_cycle_minutes: float,
+                               energy_df: Optional[pd.DataFrame] = None) -> Dict[str, Any]:
+        """
+        Detect hot water cycles and integrate their energy (vectorized)
+
+        A cycle starts on a switch valve 0→1 transition and ends at the first
+        valve sample == 0 after the start. Cycles without an end are ignored;
+        cycles shorter than min_cycle_minutes are counted as filtered.
+        Cycle ends are located with np.searchsorted over the zero-valued
+        samples, and the power samples of each cycle with np.searchsorted
+        over the power timestamps - no per-cycle DataFrame scans. The array
+        work runs in _hw_cycles on int64 ns timestamps.
+
+        Args:
+            valve_df: Time-sorted switch_valve_status rows
+            power_df: Time-sorted power_consumption rows (unused when energy_df is given)
+            min_cycle_minutes: Minimum duration for a valid cycle
+            energy_df: Optional cumulative kWh series from _query_cumulative_energy
+
+        Returns:
+            Dict with num_starts, filtered_count, starts/durations_min of the valid
+            cycles, cycle_energies_kwh (NaN where no power samples fall inside the
+            cycle), energies_kwh (valid cycles with power data) and
+            filtered_starts/filtered_durations_min for diagnostics
+        """
+        if energy_df is not None:
+            power_df = energy_df.iloc[:0]
+
+        num_starts, start_ns, end_ns, durations_min, cycle_energies = _hw_cycles(
+            _time_ns(valve_df), valve_df['_value'].to_numpy(dtype=float),
+            _time_ns(power_df), power_df['_value'].to_numpy(dtype=float),
+        )
+
+        if energy_df is not None:
+            cycle_energies = _cumulative_cycle_energy(start_ns, end_ns, _time_ns(energy_df),
+                                                      energy_df['_value'].to_numpy(dtype=float))
+        start_times = start_ns.view('datetime64[ns]')
+
+        # FILTER: Skippa cykler kortare än minimum
+        keep = durations_min >= min_cycle_minutes
+        cycle_energies = cycle_energies[keep]
+
+        return {
+            'num_starts': num_starts,
+            'filtered_count': int(np.count_nonzero(~keep)),
+            'starts': start_times[keep],
+            'durations_min': durations_min[keep],
+            'cycle_energies_kwh': cycle_energies,
+            'energies_kwh': cycle_energies[~np.isnan(cycle_energies)],
+            'filtered_starts': start_times[~keep],
+            'filtered_durations_min': durations_min[~keep],
+        }
+
     def analyze_hot_water_cycles_from_df(self, df: pd.DataFrame, time_range: str = '7d') -> Dict[str, Any]:
         """
         Analyze hot water heating cycles from pre-fetched dataframe
@@ -1061,9 +1793,10 @@ class HeatPumpDataQuery:
                     'cycles_per_day': 0
                 }
 
-            # Filter to hot water-related metrics
-            valve_df = df[df['name'] == 'switch_valve_status'].copy()
-            power_df = df[df['name'] == 'power_consumption'].copy()
+            # Split by metric in one categorical groupby (views, no per-metric scans/copies)
+            groups = dict(list(df.groupby('name', observed=True, sort=False)))
+            valve_df = groups.get('switch_valve_status', df.iloc[:0])
+            power_df = groups.get('power_consumption', df.iloc[:0])
 
             if valve_df.empty:
                 return {
@@ -1073,14 +1806,15 @@ class HeatPumpDataQuery:
                     'cycles_per_day': 0
                 }
 
-            valve_df = valve_df.sort_values('_time')
-            power_df = power_df.sort_values('_time')
+            valve_df = self._sort_by_time(valve_df)
+            power_df = self._sort_by_time(power_df)
 
-            # Detect cycles (transitions from 0 to 1)
-            valve_df['prev_value'] = valve_df['_value'].shift(1)
-            cycles_start = valve_df[(valve_df['_value'] == 1) & (valve_df['prev_value'] == 0)]
+            # Detect cycles (transitions from 0 to 1) and their energy in one vectorized pass
+            # MINIMUM DURATION FILTER - configurable in config.yaml
+            min_cycle_minutes = self.hw_min_cycle_minutes
+            cycles = self._find_hot_water_cycles(valve_df, power_df, min_cycle_minutes)
 
-            num_cycles = len(cycles_start)
+            num_cycles = cycles['num_starts']
 
             logger.info(f"Hot water cycle detection from batch data for {time_range}:")
             logger.info(f"  Detected {num_cycles} valve transitions (0→1)")
@@ -1093,47 +1827,9 @@ class HeatPumpDataQuery:
                     'cycles_per_day': 0
                 }
 
-            # Calculate average cycle duration AND energy
-            cycle_durations = []
-            cycle_energies = []
-
-            # MINIMUM DURATION FILTER - configurable in config.yaml
-            min_cycle_minutes = self.hw_min_cycle_minutes
-
-            filtered_count = 0
-
-            for start_time in cycles_start['_time']:
-                after_start = valve_df[valve_df['_time'] > start_time]
-                end_times = after_start[after_start['_value'] == 0]
-
-                if not end_times.empty:
-                    end_time = end_times.iloc[0]['_time']
-                    duration_seconds = (end_time - start_time).total_seconds()
-                    duration_minutes = duration_seconds / 60
-
-                    # FILTER: Skippa cykler kortare än minimum
-                    if duration_minutes < min_cycle_minutes:
-                        filtered_count += 1
-                        continue
-
-                    cycle_durations.append(duration_minutes)
-
-                    # Calculate energy for this cycle
-                    cycle_power = power_df[
-                        (power_df['_time'] >= start_time) &
-                        (power_df['_time'] <= end_time)
-                    ].copy()
-
-                    if not cycle_power.empty:
-                        cycle_power = cycle_power.sort_values('_time')
-                        cycle_power['time_diff_hours'] = cycle_power['_time'].diff().dt.total_seconds() / 3600
-                        cycle_power['time_diff_hours'] = cycle_power['time_diff_hours'].fillna(0)
-
-                        # Energy = Power (W) * Time (h) / 1000 = kWh
-                        cycle_power['energy_kwh'] = (cycle_power['_value'] * cycle_power['time_diff_hours']) / 1000
-
-                        total_cycle_energy = cycle_power['energy_kwh'].sum()
-                        cycle_energies.append(total_cycle_energy)
+            cycle_durations = cycles['durations_min']
+            cycle_energies = cycles['energies_kwh']
+            filtered_count = cycles['filtered_count']
 
             # Antal giltiga cykler (efter filtrering)
             num_valid_cycles = len(cycle_durations)
@@ -1148,11 +1844,12 @@ class HeatPumpDataQuery:
                     'cycles_per_day': 0
                 }
 
-            avg_duration = np.mean(cycle_durations) if cycle_durations else 0
-            avg_energy_kwh = np.mean(cycle_energies) if cycle_energies else 0
+            avg_duration = cycle_durations.mean()
+            avg_energy_kwh = np.mean(cycle_energies) if len(cycle_energies) else 0
 
             # Calculate cycles per day
-            total_days = (valve_df['_time'].max() - valve_df['_time'].min()).total_seconds() / 86400
+            valve_ns = _time_ns(valve_df)
+            total_days = (valve_ns[-1] - valve_ns[0]) / 8.64e13
             cycles_per_day = num_valid_cycles / total_days if total_days > 0 else 0
 
             return {
@@ -1179,10 +1876,17 @@ class HeatPumpDataQuery:
         KORRIGERAD: Använder nu korrekt effekt under varmvattencykler
         """
         try:
-            metrics = ['switch_valve_status', 'hot_water_top', 'power_consumption']
+            # Energin integreras i InfluxDB; effektdata hämtas bara om den frågan misslyckas
+            energy_df = self._query_cumulative_energy(time_range)
 
-            # Använd finare aggregering för varmvattenanalys
-            df = self.query_metrics(metrics, time_range, aggregation_window='1m')
+            metrics = ['switch_valve_status', 'hot_water_top']
+            if energy_df is None:
+                metrics.append('power_consumption')
+
+            # Använd finare aggregering för varmvattenanalys (ventilen behöver 1m för cykelflankerna,
+            # effekten räcker med 5m för energiintegralen)
+            df = self.query_metrics(metrics, time_range, aggregation_window='1m',
+                                    per_metric_window={'power_consumption': '5m'})
             
             if df.empty:
                 return {
@@ -1192,8 +1896,10 @@ class HeatPumpDataQuery:
                     'cycles_per_day': 0
                 }
             
-            valve_df = df[df['name'] == 'switch_valve_status'].copy()
-            power_df = df[df['name'] == 'power_consumption'].copy()
+            # Split by metric in one categorical groupby (views, no per-metric scans/copies)
+            groups = dict(list(df.groupby('name', observed=True, sort=False)))
+            valve_df = groups.get('switch_valve_status', df.iloc[:0])
+            power_df = groups.get('power_consumption', df.iloc[:0])
             
             if valve_df.empty:
                 return {
@@ -1203,14 +1909,15 @@ class HeatPumpDataQuery:
                     'cycles_per_day': 0
                 }
             
-            valve_df = valve_df.sort_values('_time')
-            power_df = power_df.sort_values('_time')
-            
-            # Detect cycles (transitions from 0 to 1)
-            valve_df['prev_value'] = valve_df['_value'].shift(1)
-            cycles_start = valve_df[(valve_df['_value'] == 1) & (valve_df['prev_value'] == 0)]
+            valve_df = self._sort_by_time(valve_df)
+            power_df = self._sort_by_time(power_df)
             
-            num_cycles = len(cycles_start)
+            # Detect cycles (transitions from 0 to 1) and their energy in one vectorized pass
+            # MINIMUM DURATION FILTER - configurable in config.yaml
+            min_cycle_minutes = self.hw_min_cycle_minutes
+            cycles = self._find_hot_water_cycles(valve_df, power_df, min_cycle_minutes, energy_df=energy_df)
+
+            num_cycles = cycles['num_starts']
             
             logger.info(f"Hot water cycle detection for {time_range}:")
             logger.info(f"  Detected {num_cycles} valve transitions (0→1)")
@@ -1224,53 +1931,17 @@ class HeatPumpDataQuery:
                     'cycles_per_day': 0
                 }
             
-            # Calculate average cycle duration AND energy
-            cycle_durations = []
-            cycle_energies = []
+            cycle_durations = cycles['durations_min']
+            cycle_energies = cycles['energies_kwh']
+            filtered_count = cycles['filtered_count']
 
-            # MINIMUM DURATION FILTER - configurable in config.yaml
-            min_cycle_minutes = self.hw_min_cycle_minutes
+            if logger.isEnabledFor(logging.DEBUG):
+                for start, duration in zip(cycles['filtered_starts'], cycles['filtered_durations_min']):
+                    logger.debug(f"  ❌ FILTRERAD kort cykel kl {pd.Timestamp(start).strftime('%H:%M:%S')}: {duration:.1f} min (< {min_cycle_minutes} min)")
+                for start, duration, energy in zip(cycles['starts'], cycle_durations, cycles['cycle_energies_kwh']):
+                    if not np.isnan(energy):
+                        logger.debug(f"  ✅ GILTIG cykel kl {pd.Timestamp(start).strftime('%H:%M:%S')}: {duration:.1f} min, {energy:.2f} kWh")
 
-            filtered_count = 0
-
-            for start_time in cycles_start['_time']:
-                after_start = valve_df[valve_df['_time'] > start_time]
-                end_times = after_start[after_start['_value'] == 0]
-
-                if not end_times.empty:
-                    end_time = end_times.iloc[0]['_time']
-                    duration_seconds = (end_time - start_time).total_seconds()
-                    duration_minutes = duration_seconds / 60
-
-                    # FILTER: Skippa cykler kortare än minimum
-                    if duration_minutes < min_cycle_minutes:
-                        filtered_count += 1
-                        logger.debug(f"  ❌ FILTRERAD kort cykel kl {start_time.strftime('%H:%M:%S')}: {duration_minutes:.1f} min (< {min_cycle_minutes} min)")
-                        continue
-                    
-                    cycle_durations.append(duration_minutes)
-                    
-                    # KORRIGERING: Beräkna energi för DENNA specifika cykel
-                    # Hämta effektdata under denna cykel
-                    cycle_power = power_df[
-                        (power_df['_time'] >= start_time) & 
-                        (power_df['_time'] <= end_time)
-                    ].copy()
-                    
-                    if not cycle_power.empty:
-                        # Beräkna energi genom att integrera effekt över tid
-                        cycle_power = cycle_power.sort_values('_time')
-                        cycle_power['time_diff_hours'] = cycle_power['_time'].diff().dt.total_seconds() / 3600
-                        cycle_power['time_diff_hours'] = cycle_power['time_diff_hours'].fillna(0)
-                        
-                        # Energy = Power (W) * Time (h) / 1000 = kWh
-                        cycle_power['energy_kwh'] = (cycle_power['_value'] * cycle_power['time_diff_hours']) / 1000
-                        
-                        total_cycle_energy = cycle_power['energy_kwh'].sum()
-                        cycle_energies.append(total_cycle_energy)
-
-                        logger.debug(f"  ✅ GILTIG cykel kl {start_time.strftime('%H:%M:%S')}: {duration_minutes:.1f} min, {total_cycle_energy:.2f} kWh")
-            
             # Antal giltiga cykler (efter filtrering)
             num_valid_cycles = len(cycle_durations)
             
@@ -1286,11 +1957,12 @@ class HeatPumpDataQuery:
                     'cycles_per_day': 0
                 }
             
-            avg_duration = np.mean(cycle_durations) if cycle_durations else 0
-            avg_energy_kwh = np.mean(cycle_energies) if cycle_energies else 0
+            avg_duration = cycle_durations.mean()
+            avg_energy_kwh = np.mean(cycle_energies) if len(cycle_energies) else 0
             
             # Calculate cycles per day - ANVÄNDER VERKLIG TID
-            total_days = (valve_df['_time'].max() - valve_df['_time'].min()).total_seconds() / 86400
+            valve_ns = _time_ns(valve_df)
+            total_days = (valve_ns[-1] - valve_ns[0]) / 8.64e13
             cycles_per_day = num_valid_cycles / total_days if total_days > 0 else 0
             
             logger.info(f"Hot water analysis for {time_range}:")
@@ -1314,7 +1986,65 @@ class HeatPumpDataQuery:
                 'avg_energy_per_cycle_kwh': 0,
                 'cycles_per_day': 0
             }
-    
+
+    def query_state_transitions(self, metric_names: List[str], time_range: str = '24h',
+                                aggregation_window: str = '1m') -> Optional[pd.DataFrame]:
+        """
+        Rows where a metric changed value, computed in InfluxDB
+
+        All metrics in one query, aggregated to aggregation_window. Only rows where
+        the value changed are returned: value = new value, _value = the change
+        (difference() motsvarar LAG), so the previous value is value - _value.
+        For sparse status metrics this is a tiny fraction of the raw samples.
+
+        Returns:
+            DataFrame with _time, name, _value (delta) and value, or None if the query failed
+        """
+        query = self._aggregate_stream(metric_names, time_range, aggregation_window, 'mean') + '''
+                    |> duplicate(column: "_value", as: "value")
+                    |> difference(columns: ["_value"], keepFirst: false)
+                    |> filter(fn: (r) => r._value != 0.0)
+                    |> keep(columns: ["_time", "name", "_value", "value"])'''
+
+        try:
+            result = self.query_api.query_data_frame(query)
+        except Exception as e:
+            logger.error(f"Error querying state transitions: {e}")
+            return None
+
+        if isinstance(result, list):
+            result = pd.concat(result, ignore_index=True, copy=False, sort=False)
+
+        return result
+
+    def _query_alarm_time(self):
+        """
+        Time of the latest sample with an active alarm code
+
+        OPTIMIZED: An active alarm is almost always found in the last hour, so the
+        range is widened (-1h, -24h, -7d) only when the narrower scan finds nothing.
+        OPTIMIZED: Uses query() (FluxTable records) instead of building a DataFrame
+        """
+        for lookback in ('-1h', '-24h', '-7d'):
+            query = f'''
+                from(bucket: "{self.bucket}")
+                    |> range(start: {lookback})
+                    |> filter(fn: (r) => r._measurement == "heatpump")
+                    |> filter(fn: (r) => r.name == "alarm_code")
+                    |> filter(fn: (r) => r._value > 0)
+                    |> last()
+                    |> keep(columns: ["_time"])
+            '''
+
+            # A single timestamp: read it from the FluxTable records, no DataFrame
+            tables = self.query_api.query(query)
+            times = [record.get_time() for table in tables for record in table.records]
+
+            if times:
+                return max(times)
+
+        return None
+
     def get_alarm_status(self) -> Dict[str, Any]:
         """Get current alarm status with description (brand-aware)"""
         try:
@@ -1328,28 +2058,18 @@ class HeatPumpDataQuery:
             # Use brand-specific alarm codes
             alarm_description = self.alarm_codes.get(alarm_code, f"Okänd larmkod: {alarm_code}")
             
-            # Hämta när larmet aktiverades
+            # Hämta när larmet aktiverades (cachat så länge samma larmkod är aktiv, även
+            # när ingen tid hittades). Larm via alarm_status med alarm_code 0 (IVT) har
+            # ingen rad med alarm_code > 0 att hitta, så ingen fråga körs då
             if is_alarm:
-                query = f'''
-                    from(bucket: "{self.bucket}")
-                        |> range(start: -7d)
-                        |> filter(fn: (r) => r._measurement == "heatpump")
-                        |> filter(fn: (r) => r.name == "alarm_code")
-                        |> filter(fn: (r) => r._value > 0)
-                        |> last()
-                '''
-                
-                result = self.query_api.query_data_frame(query)
-                
-                if isinstance(result, list):
-                    result = pd.concat(result, ignore_index=True)
-                
-                if not result.empty:
-                    alarm_time = result.iloc[0]['_time']
+                if self._cached_alarm_time is not None and self._cached_alarm_time[0] == alarm_code:
+                    alarm_time = self._cached_alarm_time[1]
                 else:
-                    alarm_time = None
+                    alarm_time = self._query_alarm_time() if alarm_code > 0 else None
+                    self._cached_alarm_time = (alarm_code, alarm_time)
             else:
                 alarm_time = None
+                self._cached_alarm_time = None
             
             return {
                 'is_alarm': is_alarm,
@@ -1369,7 +2089,8 @@ class HeatPumpDataQuery:
                 'alarm_status_raw': 0
             }
     
-    def get_event_log(self, limit: int = 10) -> List[Dict[str, Any]]:
+    def get_event_log(self, limit: int = 10,
+                      as_frame: bool = False) -> Union[List[Dict[str, Any]], pd.DataFrame]:
         """
         Get recent events (state changes) from the heat pump
         
@@ -1380,218 +2101,72 @@ class HeatPumpDataQuery:
         - Additional heater ON/OFF
         - Hot water cycle start/stop
         - Alarms
+
+        OPTIMIZED: The result is cached for _EVENT_LOG_CACHE_TTL seconds, so repeated
+        dashboard polls within that window skip the query and edge detection
+
+        Args:
+            limit: Max antal händelser (senaste först)
+            as_frame: Return a columnar DataFrame (see _events_frame) instead of a list of dicts
         """
-        try:
-            events = []
-            
-            # Hämta state changes för de senaste 24 timmarna
-            metrics = [
-                'compressor_status',
-                'brine_pump_status',
-                'radiator_pump_status',
-                'switch_valve_status',
-                'additional_heat_percent',
-                'alarm_code',
-                'alarm_status'
-            ]
-            
-            logger.info(f"Fetching event log for {len(metrics)} metrics...")
-            
-            for metric in metrics:
-                # Aggregera till 1-minuters intervall
-                query = f'''
-                    from(bucket: "{self.bucket}")
-                        |> range(start: -24h)
-                        |> filter(fn: (r) => r._measurement == "heatpump")
-                        |> filter(fn: (r) => r.name == "{metric}")
-                        |> aggregateWindow(every: 1m, fn: mean, createEmpty: false)
-                        |> yield(name: "mean")
-                '''
-                
-                logger.debug(f"Querying metric: {metric}")
-                result = self.query_api.query_data_frame(query)
-                
-                if isinstance(result, list):
-                    result = pd.concat(result, ignore_index=True)
-                
-                if result.empty:
-                    logger.debug(f"No data for {metric}")
-                    continue
-                
-                logger.info(f"Got {len(result)} rows for {metric}")
-                
-                result = result.sort_values('_time')
-                
-                # Detektera state changes
-                result['prev_value'] = result['_value'].shift(1)
-                
-                # Räkna antal changes
-                changes_detected = 0
-                
-                for idx, row in result.iterrows():
-                    if pd.isna(row['prev_value']):
-                        continue
-                    
-                    current = row['_value']
-                    previous = row['prev_value']
-                    timestamp = row['_time']
-                    
-                    # Kompressor
-                    if metric == 'compressor_status':
-                        if current > 0 and previous == 0:
-                            events.append({
-                                'time': timestamp,
-                                'event': 'Kompressor PÅ',
-                                'type': 'info',
-                                'icon': '🔄'
-                            })
-                            changes_detected += 1
-                        elif current == 0 and previous > 0:
-                            events.append({
-                                'time': timestamp,
-                                'event': 'Kompressor AV',
-                                'type': 'info',
-                                'icon': '⏸️'
-                            })
-                            changes_detected += 1
-                    
-                    # Köldbärarpump
-                    elif metric == 'brine_pump_status':
-                        if current > 0 and previous == 0:
-                            events.append({
-                                'time': timestamp,
-                                'event': 'Köldbärarpump PÅ',
-                                'type': 'info',
-                                'icon': '💧'
-                            })
-                            changes_detected += 1
-                        elif current == 0 and previous > 0:
-                            events.append({
-                                'time': timestamp,
-                                'event': 'Köldbärarpump AV',
-                                'type': 'info',
-                                'icon': '💧'
-                            })
-                            changes_detected += 1
-                    
-                    # Radiatorpump
-                    elif metric == 'radiator_pump_status':
-                        if current > 0 and previous == 0:
-                            events.append({
-                                'time': timestamp,
-                                'event': 'Radiatorpump PÅ',
-                                'type': 'info',
-                                'icon': '📡'
-                            })
-                            changes_detected += 1
-                        elif current == 0 and previous > 0:
-                            events.append({
-                                'time': timestamp,
-                                'event': 'Radiatorpump AV',
-                                'type': 'info',
-                                'icon': '📡'
-                            })
-                            changes_detected += 1
-                    
-                    # Varmvattencykel
-                    elif metric == 'switch_valve_status':
-                        if current == 1 and previous == 0:
-                            events.append({
-                                'time': timestamp,
-                                'event': 'Varmvattencykel START',
-                                'type': 'info',
-                                'icon': '🚿'
-                            })
-                            changes_detected += 1
-                        elif current == 0 and previous == 1:
-                            events.append({
-                                'time': timestamp,
-                                'event': 'Varmvattencykel STOPP',
-                                'type': 'info',
-                                'icon': '🚿'
-                            })
-                            changes_detected += 1
-                    
-                    # Tillsattsvärme
-                    elif metric == 'additional_heat_percent':
-                        if current > 0 and previous == 0:
-                            events.append({
-                                'time': timestamp,
-                                'event': f'Tillsattsvärme PÅ ({int(current)}%)',
-                                'type': 'warning',
-                                'icon': '🔥'
-                            })
-                            changes_detected += 1
-                        elif current == 0 and previous > 0:
-                            events.append({
-                                'time': timestamp,
-                                'event': 'Tillsattsvärme AV',
-                                'type': 'info',
-                                'icon': '🔥'
-                            })
-                            changes_detected += 1
-                        elif current > 0 and previous > 0 and abs(current - previous) > 10:
-                            events.append({
-                                'time': timestamp,
-                                'event': f'Tillsattsvärme ändrad till {int(current)}%',
-                                'type': 'warning',
-                                'icon': '🔥'
-                            })
-                            changes_detected += 1
-                    
-                    # Larm (brand-aware)
-                    elif metric == 'alarm_code':
-                        if current > 0 and previous == 0:
-                            alarm_desc = self.alarm_codes.get(int(current), f"Kod {int(current)}")
-                            events.append({
-                                'time': timestamp,
-                                'event': f'LARM - {alarm_desc}',
-                                'type': 'danger',
-                                'icon': '⚠️'
-                            })
-                            changes_detected += 1
-                        elif current == 0 and previous > 0:
-                            events.append({
-                                'time': timestamp,
-                                'event': 'Larm återställt',
-                                'type': 'success',
-                                'icon': '✅'
-                            })
-                            changes_detected += 1
-
-                    # Larmstatus (IVT uses alarm_status to signal active alarms)
-                    elif metric == 'alarm_status':
-                        if current > 0 and previous == 0:
-                            events.append({
-                                'time': timestamp,
-                                'event': 'Larm aktiverat',
-                                'type': 'danger',
-                                'icon': '⚠️'
-                            })
-                            changes_detected += 1
-                        elif current == 0 and previous > 0:
-                            events.append({
-                                'time': timestamp,
-                                'event': 'Larm återställt',
-                                'type': 'success',
-                                'icon': '✅'
-                            })
-                            changes_detected += 1
-
-                logger.info(f"Detected {changes_detected} changes for {metric}")
-            
-            logger.info(f"Total events before sorting: {len(events)}")
-            
-            # Sortera efter tid (senaste först)
-            events = sorted(events, key=lambda x: x['time'], reverse=True)
-            
-            # Begränsa till antal
-            events = events[:limit]
-            
-            logger.info(f"Returning {len(events)} events after limit")
-            
-            return events
-            
-        except Exception as e:
-            logger.error(f"Error getting event log: {e}")
-            return []
+        cache_key = ('get_event_log', limit)
+        cached = self._cache_get(cache_key, ttl=self._EVENT_LOG_CACHE_TTL)
+        if cached is not None:
+            return self._events_frame(cached) if as_frame else list(cached)
+
+        # Hämta state changes för de senaste 24 timmarna
+        metrics = [
+            'compressor_status',
+            'brine_pump_status',
+            'radiator_pump_status',
+            'switch_valve_status',
+            'additional_heat_percent',
+            'alarm_code',
+            'alarm_status'
+        ]
+
+        logger.info("Fetching event log for %d metrics...", len(metrics))
+
+        # Only the InfluxDB round trip is guarded; errors in the processing below are bugs
+        result = self.query_state_transitions(metrics, '24h')
+        if result is None:
+            return self._events_frame([]) if as_frame else []
+
+        groups = dict(list(result.groupby('name', sort=False))) if not result.empty else {}
+
+        per_metric_events = []
+        for metric in metrics:
+            result = groups.get(metric)
+
+            if result is None or result.empty:
+                logger.debug("No data for %s", metric)
+                continue
+
+            logger.info("Got %d changed rows for %s", len(result), metric)
+
+            result = result.sort_values('_time')
+
+            # Detektera state changes (vektoriserat: varje ändring mot sitt föregående värde)
+            values = result['value'].to_numpy(dtype=float)
+            previous = values - result['_value'].to_numpy(dtype=float)
+            times = result['_time'].array
+
+            # Växelventilen rapporterar exakt 0/1
+            on_value = 1 if metric == 'switch_valve_status' else None
+
+            metric_events = self._metric_events(metric, times, values, on_value, previous=previous, limit=limit)
+            per_metric_events.append(metric_events)
+
+            logger.info("Detected %d changes for %s", len(metric_events), metric)
+
+        logger.info("Total events before sorting: %d", sum(map(len, per_metric_events)))
+
+        # De senaste `limit` händelserna, senaste först: listorna per metric är redan sorterade,
+        # så de flätas ihop istället för att sorteras. Bara de som returneras byggs om till dicts
+        newest = heapq.merge(*per_metric_events, key=itemgetter(0), reverse=True)
+        events = [self._event_dict(event) for event in islice(newest, limit)]
+
+        logger.info("Returning %d events after limit", len(events))
+
+        self._cache_put(cache_key, events)
+        return self._events_frame(events) if as_frame else list(events)
@@ -7,6 +7,7 @@ To add a new brand:
 2. Create provider.py with a class named <Brand>Provider (e.g., BoschProvider)
    - The class must inherit from HeatPumpProvider
    - Implement all abstract methods
+   - Declare it at the end of the module: PROVIDER_CLASS = BoschProvider
 3. Create registers.py with register definitions
 4. Create alarms.py with alarm code definitions
 5. Done! The factory will auto-discover your provider.
@@ -14,10 +15,10 @@ To add a new brand:
 No changes to this file are required when adding new brands.
 """
 
+import functools
 import importlib
 import logging
 import os
-from pathlib import Path
 from typing import Optional, List, Dict, Type
 
 from .base import HeatPumpProvider
@@ -29,12 +30,33 @@ _provider_cache: Dict[str, Type[HeatPumpProvider]] = {}
 _discovery_done: bool = False
 
 
+@functools.lru_cache(maxsize=64)
+def _normalize(brand: str) -> str:
+    """Normalized (lowercase, stripped) brand name - cached, brands come from a small fixed set"""
+    return brand.lower().strip()
+
+
+def _find_provider_class(module) -> Optional[Type[HeatPumpProvider]]:
+    """
+    Find the provider class in a module without PROVIDER_CLASS
+    (looks for a HeatPumpProvider subclass whose name ends with 'Provider').
+    """
+    for attr_name in dir(module):
+        attr = getattr(module, attr_name)
+        if (isinstance(attr, type) and
+            issubclass(attr, HeatPumpProvider) and
+            attr is not HeatPumpProvider and
+            attr_name.endswith('Provider')):
+            return attr
+    return None
+
+
 def _discover_providers() -> Dict[str, Type[HeatPumpProvider]]:
     """
     Auto-discover all available providers by scanning the providers directory.
 
-    Looks for directories containing a provider.py file with a class
-    that inherits from HeatPumpProvider.
+    Looks for directories containing a provider.py file that declares
+    PROVIDER_CLASS (or otherwise defines a HeatPumpProvider subclass).
 
     Returns:
         Dictionary mapping brand names to provider classes
@@ -44,34 +66,30 @@ def _discover_providers() -> Dict[str, Type[HeatPumpProvider]]:
     if _discovery_done:
         return _provider_cache
 
-    providers_dir = Path(__file__).parent
+    providers_dir = os.path.dirname(__file__)
 
-    for item in providers_dir.iterdir():
-        # Skip non-directories and special directories
-        if not item.is_dir() or item.name.startswith('_'):
-            continue
+    # OPTIMIZED: os.scandir() - DirEntry caches is_dir(), no extra stat per entry
+    with os.scandir(providers_dir) as entries:
+        brand_dirs = [
+            entry.name for entry in entries
+            if entry.is_dir() and not entry.name.startswith('_')
+        ]
 
+    for dir_name in brand_dirs:
         # Check for provider.py in the directory
-        provider_file = item / 'provider.py'
-        if not provider_file.exists():
+        if not os.path.isfile(os.path.join(providers_dir, dir_name, 'provider.py')):
             continue
 
-        brand_name = item.name.lower()
+        brand_name = dir_name.lower()
 
         try:
             # Import the provider module
             module = importlib.import_module(f'providers.{brand_name}.provider')
 
-            # Find the provider class (look for class ending with 'Provider')
-            provider_class = None
-            for attr_name in dir(module):
-                attr = getattr(module, attr_name)
-                if (isinstance(attr, type) and
-                    issubclass(attr, HeatPumpProvider) and
-                    attr is not HeatPumpProvider and
-                    attr_name.endswith('Provider')):
-                    provider_class = attr
-                    break
+            # OPTIMIZED: Modules declare PROVIDER_CLASS - O(1) lookup instead of scanning dir()
+            provider_class = getattr(module, 'PROVIDER_CLASS', None)
+            if provider_class is None:
+                provider_class = _find_provider_class(module)
 
             if provider_class:
                 _provider_cache[brand_name] = provider_class
@@ -92,6 +110,8 @@ def get_provider(brand: str) -> HeatPumpProvider:
     Factory function to get the appropriate provider for a brand.
 
     Uses auto-discovery to find available providers - no hardcoding required.
+    OPTIMIZED: Providers are stateless after init, so one shared instance
+    per brand is returned.
 
     Args:
         brand: Brand name (e.g., 'thermia', 'ivt', 'nibe')
@@ -107,7 +127,12 @@ def get_provider(brand: str) -> HeatPumpProvider:
         >>> print(provider.get_display_name())
         'Thermia Diplomat'
     """
-    brand = brand.lower().strip()
+    return _get_provider_instance(_normalize(brand))
+
+
+@functools.lru_cache(maxsize=None)
+def _get_provider_instance(brand: str) -> HeatPumpProvider:
+    """Shared provider instance for a normalized brand name"""
     providers = _discover_providers()
 
     if brand not in providers:
@@ -143,7 +168,7 @@ def is_brand_supported(brand: str) -> bool:
         True if brand is supported
     """
     providers = _discover_providers()
-    return brand.lower().strip() in providers
+    return _normalize(brand) in providers
 
 
 def get_provider_class(brand: str) -> Optional[Type[HeatPumpProvider]]:
@@ -159,7 +184,7 @@ def get_provider_class(brand: str) -> Optional[Type[HeatPumpProvider]]:
         Provider class or None if not found
     """
     providers = _discover_providers()
-    return providers.get(brand.lower().strip())
+    return providers.get(_normalize(brand))
 
 
 def reload_providers() -> None:
@@ -171,6 +196,7 @@ def reload_providers() -> None:
     global _provider_cache, _discovery_done
     _provider_cache = {}
     _discovery_done = False
+    _get_provider_instance.cache_clear()
     _discover_providers()
 
 
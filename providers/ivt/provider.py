@@ -190,3 +190,7 @@ class IVTProvider(HeatPumpProvider):
                 'description': 'Can reset alarms via register write'
             }
         }
+
+
+# Provider class picked up by providers._discover_providers()
+PROVIDER_CLASS = IVTProvider
@@ -291,3 +291,7 @@ class NIBEProvider(HeatPumpProvider):
 
         # Default: accept any value
         return True
+
+
+# Provider class picked up by providers._discover_providers()
+PROVIDER_CLASS = NIBEProvider
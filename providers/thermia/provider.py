@@ -128,3 +128,7 @@ class ThermiaProvider(HeatPumpProvider):
                 'energy_register': '5FAB'
             }
         }
+
+
+# Provider class picked up by providers._discover_providers()
+PROVIDER_CLASS = ThermiaProvider